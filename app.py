@@ -1,26 +1,125 @@
-import os
-from fastapi import FastAPI, HTTPException, status
+from contextlib import asynccontextmanager
+from typing import Annotated, Any, AsyncIterator, Literal, Optional
+from fastapi import Body, Depends, FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from bson import ObjectId
 from pydantic import ValidationError
-from pymongo import MongoClient
-from schema.user import User, UserResponse
-from routers import items
+from pymongo.errors import DuplicateKeyError
+from cache.batching import BatchLoader, UserLoaderDep
+from cache.change_stream import UserChangeStreamInvalidator
+from cache.settings import CacheSettings, LookupSettings
+from cache.single_flight import SingleFlight, UserLookupsDep
+from cache.etag import etag_matches
+from cache.users import CachedBody, UserCache, UserCacheDep
+from database.connection import MongoConnection
+from database.indexes import IndexManager
+from database.settings import DatabaseSettings
+from repositories.jobs import ImportJobsRepository, JobsRepository
+from repositories.settings import WriteBehindSettings
+from repositories.users import UsersRepository, UsersRepositoryDep
+from repositories.write_behind import UserInsertBatcher, UserWriterDep
+from schema.bulk import (
+    BulkCreateResponse,
+    BulkItemResult,
+    BulkLimits,
+    BulkUserOperation,
+    BulkWriteResponse,
+    describe_validation_error
+)
+from schema.pagination import PageCursor, PaginationLimits
+from schema.responses import FastJSONResponse, dumps
+from schema.user import User, UserRecordAdapter, UserRecords, UserResponse
+from jobs.exports import UserExports
+from jobs.imports import UserImports
+from jobs.settings import ExportSettings
+from routers import exports, imports, items, metrics
+
+mongo = MongoConnection(DatabaseSettings.from_env())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the client and pre-warm its pool before the app reports ready
+    await mongo.connect()
+    mongo.start_warmup()
+    app.state.users = UsersRepository(mongo.get_collection(UsersRepository.COLLECTION))
+    cache_settings = CacheSettings.from_env()
+    app.state.user_cache = UserCache.from_settings(cache_settings)
+    app.state.user_cache.start()
+    app.state.user_change_stream = None
+    if cache_settings.enabled and cache_settings.change_stream:
+        app.state.user_change_stream = UserChangeStreamInvalidator(
+            app.state.users.collection,
+            mongo.get_collection("change_stream_state"),
+            app.state.user_cache,
+            cache_settings.change_stream_consumer
+        )
+        app.state.user_change_stream.start()
+    lookup_settings = LookupSettings.from_env()
+    app.state.user_loader = None
+    if lookup_settings.batch:
+        app.state.user_loader = BatchLoader(
+            app.state.users.search_many,
+            lookup_settings.batch_window_ms / 1000,
+            lookup_settings.batch_max_keys
+        )
+    write_settings = WriteBehindSettings.from_env()
+    app.state.user_writer = None
+    if write_settings.batch:
+        app.state.user_writer = UserInsertBatcher(
+            app.state.users,
+            write_settings.batch_interval_ms / 1000,
+            write_settings.batch_max_docs
+        )
+    app.state.user_indexes = IndexManager(app.state.users.collection, UsersRepository.INDEXES)
+    app.state.user_indexes.start()
+    # Job statuses live in MongoDB, so every worker can report on every job
+    app.state.import_jobs = ImportJobsRepository(mongo.get_collection(JobsRepository.IMPORTS_COLLECTION),
+                                                 mongo.get_collection(ImportJobsRepository.ERRORS_COLLECTION))
+    app.state.import_error_indexes = IndexManager(app.state.import_jobs.errors_collection,
+                                                  ImportJobsRepository.ERRORS_INDEXES)
+    app.state.import_error_indexes.start()
+    app.state.export_jobs = JobsRepository(mongo.get_collection(JobsRepository.EXPORTS_COLLECTION))
+
+    try:
+        yield
+    finally:
+        await app.state.user_indexes.stop()
+        await app.state.import_error_indexes.stop()
+        await app.state.user_imports.close()
+        await app.state.user_exports.close()
+        if app.state.user_writer is not None:
+            # Write what is still queued before the client goes away
+            await app.state.user_writer.close()
+        if app.state.user_change_stream is not None:
+            await app.state.user_change_stream.stop()
+        await app.state.user_cache.close()
+        if app.state.user_loader is not None:
+            await app.state.user_loader.close()
+        await mongo.close()
+
 
 app = FastAPI(
     title="Fast API with MongoDB",
     summary="A sample application showing how to use FastAPI to add a ReST API to a MongoDB collection.",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
-app.include_router(items.router, prefix="/item", tags=["Items"])
-
-db_url: str = os.environ["MONGODB_URL"]
-client: MongoClient = MongoClient(db_url)
-
-db = client.get_database("fastapi-mongodb")
-collections = db.list_collection_names()
-print("Collections in the database:", collections)
+app.state.mongo = mongo
+# Shared by every request, so concurrent identical lookups coalesce
+app.state.user_lookups = SingleFlight()
+# Set up at start-up when USER_LOOKUP_BATCH and USER_WRITE_BATCH are enabled
+app.state.user_loader = None
+app.state.user_writer = None
+# Imports run by this worker; the spool directory is only created on the first upload
+app.state.user_imports = UserImports()
+app.state.user_exports = UserExports(ExportSettings.from_env().directory)
 
-data = db.get_collection("fastapi-mongodb").find_one({"info": "Mongo DB"})
-print("Data in the collection:", data)
+app.include_router(items.router, prefix="/item", tags=["Items"])
+app.include_router(metrics.router, prefix="/metrics", tags=["Metrics"])
+app.include_router(imports.router, prefix="/users/import", tags=["Imports"])
+app.include_router(exports.router, prefix="/users/export", tags=["Exports"])
 
 
 @app.get("/")
@@ -29,24 +128,36 @@ async def root():
 
 
 @app.post("/users/", response_model=User, status_code=status.HTTP_201_CREATED)
-async def create_user(user: User):
+async def create_user(user: User, repository: UsersRepositoryDep, cache: UserCacheDep, writer: UserWriterDep,
+                      confirm: bool = False):
     try:
-        # Convert the user model to a dictionary for MongoDB
-        user_dict = user.model_dump(by_alias=True)
-
-        # Insert the user into the database
-        result = db.get_collection("users").insert_one(user_dict)
-
-        # Get the created user from the database to return
-        created_user = db.get_collection("users").find_one({"_id": result.inserted_id})
+        # Insert the user into the database, in a shared batch when write-behind is on
+        if writer is not None:
+            created_user = await writer.insert(user)
+        else:
+            created_user = await repository.insert(user)
+        await cache.invalidate_user(user.email, user.username)
 
-        if created_user is None:
+        if created_user["_id"] is None:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                                 detail="Failed to create user")
 
+        if confirm:
+            # Read the user back for callers that want what the database stored
+            created_user = await repository.get_by_id(created_user["_id"])
+
+            if created_user is None:
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                    detail="Failed to create user")
+
         # Return the created user
         return User.model_validate(created_user)
 
+    except HTTPException as http_err:
+        raise http_err
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="A user with this email or username already exists")
     except ValidationError as err:
         # Properly handle validation errors
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
@@ -57,14 +168,161 @@ async def create_user(user: User):
                             detail=str(err))
 
 
+@app.post("/users/bulk", response_model=BulkCreateResponse, status_code=status.HTTP_200_OK)
+async def create_users_bulk(
+        repository: UsersRepositoryDep,
+        cache: UserCacheDep,
+        payload: list[dict[str, Any]] = Body(..., max_length=BulkLimits.MAX_ITEMS),
+        chunk_size: int = Query(BulkLimits.DEFAULT_CHUNK_SIZE, ge=1, le=BulkLimits.MAX_CHUNK_SIZE)):
+    # Validate every item first; invalid ones are reported instead of failing the request
+    results: list[Optional[BulkItemResult]] = [None] * len(payload)
+    valid_users: list[User] = []
+    valid_indexes: list[int] = []
+    for index, item in enumerate(payload):
+        try:
+            valid_users.append(User.model_validate(item))
+            valid_indexes.append(index)
+        except ValidationError as err:
+            results[index] = BulkItemResult(index=index, error=describe_validation_error(err))
+
+    try:
+        inserted = await repository.insert_many(valid_users, chunk_size)
+        await cache.invalidate_users((user.email, user.username) for user in valid_users)
+    except Exception as err:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=str(err))
+
+    for index, (inserted_id, error) in zip(valid_indexes, inserted):
+        results[index] = BulkItemResult(
+            index=index,
+            id=str(inserted_id) if inserted_id is not None else None,
+            error=error
+        )
+
+    created = sum(1 for result in results if result.error is None)
+    return BulkCreateResponse(created=created, failed=len(results) - created, results=results)
+
+
+@app.post("/users/bulk/write", response_model=BulkWriteResponse, status_code=status.HTTP_200_OK)
+async def write_users_bulk(
+        repository: UsersRepositoryDep,
+        cache: UserCacheDep,
+        operations: list[BulkUserOperation] = Body(..., max_length=BulkLimits.MAX_ITEMS),
+        chunk_size: int = Query(BulkLimits.DEFAULT_CHUNK_SIZE, ge=1, le=BulkLimits.MAX_CHUNK_SIZE)):
+    try:
+        chunks, errors = await repository.bulk_write(operations, chunk_size)
+        await cache.invalidate_users(
+            (operation.email, operation.changes.username if operation.changes else None)
+            for operation in operations
+        )
+    except Exception as err:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=str(err))
+
+    return BulkWriteResponse(
+        matched=sum(chunk.matched for chunk in chunks),
+        modified=sum(chunk.modified for chunk in chunks),
+        deleted=sum(chunk.deleted for chunk in chunks),
+        chunks=chunks,
+        errors=[BulkItemResult(index=index, error=error) for index, error in sorted(errors.items())]
+    )
+
+
+def cached_json_response(request: Request, cached: CachedBody) -> Response:
+    headers = {"ETag": cached.etag}
+    if cached.next_cursor is not None:
+        headers[PaginationLimits.NEXT_CURSOR_HEADER] = cached.next_cursor
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        # The client already has this body, so do not send it again
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
+def requested_fields(fields: Optional[str] = None) -> Optional[list[str]]:
+    """Comma-separated subset of the UserResponse fields to return"""
+    if fields is None:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    if not names:
+        # An empty projection would exclude only _id and fetch every stored field
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="fields must name at least one field")
+    try:
+        UsersRepository.projection(names)
+    except ValueError as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=str(err))
+    return names
+
+
+FieldsDep = Annotated[Optional[list[str]], Depends(requested_fields)]
+
+
+def partial_user(user: dict, fields: list[str]) -> dict:
+    return {field: user[field] for field in fields if field in user}
+
+
+async def stream_users_ndjson(repository: UsersRepository, after: Optional[ObjectId],
+                              fields: Optional[list[str]]) -> AsyncIterator[bytes]:
+    # One line per user, written as soon as the cursor hands it over
+    async for user in repository.iterate(after=after, fields=fields):
+        if fields is None:
+            yield UserRecordAdapter.dump_json(UserRecordAdapter.validate_python(user)) + b"\n"
+        else:
+            yield dumps(partial_user(user, fields)) + b"\n"
+
+
 @app.get("/users/", response_model=list[UserResponse], status_code=status.HTTP_200_OK)
-async def get_users():
+async def get_users(
+        request: Request,
+        repository: UsersRepositoryDep,
+        cache: UserCacheDep,
+        fields: FieldsDep,
+        limit: int = Query(PaginationLimits.DEFAULT_PAGE_SIZE, ge=1, le=PaginationLimits.MAX_PAGE_SIZE),
+        after: Optional[str] = None,
+        output_format: Literal["json", "ndjson"] = Query("json", alias="format")):
     try:
-        # Fetch all users from the database
-        users = db.get_collection("users").find()
-        user_list = [UserResponse.model_validate(user) for user in users]
+        after_id = PageCursor.decode(after) if after is not None else None
+    except ValueError as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=str(err))
 
-        return user_list
+    if output_format == "ndjson":
+        # Stream every user after the cursor; limit only applies to JSON pages
+        return StreamingResponse(stream_users_ndjson(repository, after_id, fields),
+                                 media_type="application/x-ndjson")
+
+    try:
+        page_key = None
+        if fields is None:
+            page_key = await cache.page_key(f"{after or ''}:{limit}")
+        if page_key is not None:
+            # The key moves on with every write, so a hit is current without asking MongoDB
+            cached_page = await cache.get_page(page_key)
+            if cached_page is not None:
+                return cached_json_response(request, cached_page)
+
+        # Fetch one extra user to know whether there is a next page
+        users = await repository.list_page(after=after_id, limit=limit + 1, fields=fields)
+
+        headers = {}
+        next_cursor = None
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = PageCursor.encode(users[-1]["_id"])
+            headers[PaginationLimits.NEXT_CURSOR_HEADER] = next_cursor
+
+        if fields is not None:
+            # A narrowed user no longer fits UserResponse, so skip response_model
+            return FastJSONResponse(content=[partial_user(user, fields) for user in users],
+                                    headers=headers)
+
+        # Validate the page once and hand back bytes, so response_model does not run again
+        users = UserRecords.validate_python(users)
+        page = CachedBody.of(UserRecords.dump_json(users), next_cursor)
+        if page_key is not None:
+            await cache.set_page(page_key, page)
+        return cached_json_response(request, page)
 
     except Exception as err:
         # Handle other errors
@@ -72,19 +330,46 @@ async def get_users():
                             detail=str(err))
 
 
+async def load_user_lookup(search: str, repository: UsersRepository, cache: UserCache,
+                           loader: Optional[BatchLoader]) -> Optional[CachedBody]:
+    """Read the users matching ``search`` and cache their serialized lookup"""
+    # Taken before the read, so a write landing during it keeps the result out of the cache
+    generation = await cache.lookup_generation()
+    if loader is not None:
+        # Wait briefly so lookups of other users share the query
+        users = await loader.load(search)
+    else:
+        users = await repository.search(search, include_id=True)
+    if not users:
+        return None
+    return await cache.set(search, users, generation)
+
+
 @app.get("/users/{search}", response_model=list[UserResponse], status_code=status.HTTP_200_OK)
-async def get_user(search: str):
+async def get_user(search: str, request: Request, repository: UsersRepositoryDep, cache: UserCacheDep,
+                   lookups: UserLookupsDep, loader: UserLoaderDep, fields: FieldsDep):
     try:
-        # Fetch all users from the database
-        users = db.get_collection("users").find({"$or": [{"email": search}, {"username": search}]})
+        if fields is not None:
+            # Fetch the users matching either the email or the username;
+            # identical lookups in flight share one query
+            users = await lookups.run((search, *fields), lambda: repository.search(search, fields=fields))
 
-        user_list = [UserResponse.model_validate(user) for user in users]
+            if not users:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                    detail="No user found")
 
-        if not user_list:
+            return FastJSONResponse(content=[partial_user(user, fields) for user in users])
+
+        cached_users = await cache.get(search)
+        if cached_users is None:
+            # Concurrent misses for the same search share one query and one cache fill
+            cached_users = await lookups.run(search, lambda: load_user_lookup(search, repository, cache, loader))
+
+        if cached_users is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail="No user found")
 
-        return user_list
+        return cached_json_response(request, cached_users)
 
     except HTTPException as http_err:
         raise http_err
@@ -95,19 +380,21 @@ async def get_user(search: str):
 
 
 @app.delete("/users/{email}", status_code=status.HTTP_200_OK)
-async def delete_user(email: str):
+async def delete_user(email: str, repository: UsersRepositoryDep, cache: UserCacheDep):
     try:
-        # Fetch all users from the database
-        users = db.get_collection("users").find({"email": email})
+        # Find and delete the user in a single atomic command
+        deleted_user = await repository.delete(email)
 
-        user_list = [user for user in users]
-
-        if not user_list:
+        if deleted_user is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                                 detail="No user found")
-        else:
-            db.get_collection("users").delete_one({"email": email})
-            return {"message": f"User with email {email} deleted successfully"}
+
+        await cache.invalidate_user(email, deleted_user.get("username"))
+
+        return {
+            "message": f"User with email {email} deleted successfully",
+            "user": UserResponse.model_validate(deleted_user)
+        }
 
     except HTTPException as http_err:
         raise http_err
@@ -117,13 +404,29 @@ async def delete_user(email: str):
                             detail=str(err))
 
 @app.put("/users/", response_model=dict, status_code=status.HTTP_200_OK)
-async def update_user(user: User, email: str):
+async def update_user(user: User, email: str, repository: UsersRepositoryDep, cache: UserCacheDep,
+                      return_document: bool = False):
     try:
-        user_dict = user.model_dump(by_alias=True)
-        result = db.get_collection("users").update_one(
-            {"email": email},
-            {"$set": user_dict}
-        )
+        if return_document:
+            # Update and fetch the new version in one round trip; find_one_and_update
+            # does not tell whether anything changed, so there is no 304 in this mode
+            updated_user = await repository.update_and_return(email, user)
+            await cache.invalidate_users([(email, None), (user.email, user.username)])
+
+            if updated_user is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"User with email {email} not found"
+                )
+
+            return {
+                "status": "success",
+                "message": f"User with email {email} updated successfully",
+                "user": UserResponse.model_validate(updated_user)
+            }
+
+        result = await repository.update(email, user)
+        await cache.invalidate_users([(email, None), (user.email, user.username)])
 
         if result.matched_count == 0:
             raise HTTPException(
@@ -144,6 +447,11 @@ async def update_user(user: User, email: str):
 
     except HTTPException as http_err:
         raise http_err
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A user with this email or username already exists"
+        )
     except Exception as err:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
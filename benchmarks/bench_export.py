@@ -0,0 +1,80 @@
+"""
+Measure how export time scales with the number of ``_id`` range partitions.
+
+Usage:
+    MONGODB_URL=... python benchmarks/bench_export.py [--seed 1000000] [--partitions 1 2 4 8 16]
+
+This needs a running MongoDB. ``--seed`` first fills the ``users`` collection
+of MONGODB_DATABASE (default ``bench-export``, so no real data is touched)
+with that many generated users. Shards are written to a temporary directory
+and removed afterwards.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.connection import MongoConnection  # noqa: E402
+from database.settings import DatabaseSettings  # noqa: E402
+from jobs.exports import UserExportJob  # noqa: E402
+from repositories.jobs import JobsRepository  # noqa: E402
+from repositories.users import UsersRepository  # noqa: E402
+from schema.exports import ExportJobStatus  # noqa: E402
+from schema.user import User  # noqa: E402
+
+
+async def seed(repository: UsersRepository, count: int) -> None:
+    await repository.collection.delete_many({})
+    users = [User(username=f"user_{index}", email=f"user.{index}@example.com", full_name=f"User {index}",
+                  roles=["user"]) for index in range(count)]
+    await repository.insert_many(users, chunk_size=10000)
+
+
+async def export(repository: UsersRepository, jobs: JobsRepository, partitions: int, output_format: str,
+                 directory: str) -> tuple[float, int]:
+    now = datetime.now(timezone.utc)
+    status = ExportJobStatus(id=f"bench-{partitions}", format=output_format,
+                             directory=os.path.join(directory, str(partitions)),
+                             worker="bench", created_at=now, updated_at=now)
+    started = time.perf_counter()
+    await UserExportJob(status, partitions, jobs).run(repository)
+    elapsed = time.perf_counter() - started
+    if status.state != "succeeded":
+        raise RuntimeError(status.error)
+    return elapsed, status.documents
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--partitions", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--format", choices=["ndjson", "parquet"], default="ndjson")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MONGODB_DATABASE", "bench-export")
+    mongo = MongoConnection(DatabaseSettings.from_env())
+    await mongo.connect()
+    try:
+        repository = UsersRepository(mongo.get_collection(UsersRepository.COLLECTION))
+        jobs = JobsRepository(mongo.get_collection(JobsRepository.EXPORTS_COLLECTION))
+        if args.seed:
+            await seed(repository, args.seed)
+
+        with tempfile.TemporaryDirectory(prefix="bench-export-") as directory:
+            baseline = None
+            for partitions in args.partitions:
+                elapsed, documents = await export(repository, jobs, partitions, args.format, directory)
+                baseline = baseline or elapsed
+                print(f"{partitions:>3} partitions: {elapsed:8.2f} s  {documents / elapsed:10.0f} users/s  "
+                      f"({baseline / elapsed:4.1f}x)")
+    finally:
+        await mongo.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
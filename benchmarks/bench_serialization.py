@@ -0,0 +1,94 @@
+"""
+Measure how long it takes to render a 10k-user ``/users/`` response body with
+the stock JSON response (``jsonable_encoder`` + ``json.dumps``), with
+``FastJSONResponse`` (orjson), and with pydantic serializers.
+
+The "validate" cases include turning the database documents into output:
+once per document through ``UserResponse`` (parsing every email address),
+or once per list through ``UserRecords`` as ``get_users`` does.
+
+Usage:
+    python benchmarks/bench_serialization.py [--users 10000] [--runs 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema.responses import FastJSONResponse, orjson  # noqa: E402
+from schema.user import UserRecords, UserResponse  # noqa: E402
+
+UserResponses = TypeAdapter(list[UserResponse])
+
+
+def make_documents(count: int) -> list[dict]:
+    signup = datetime(2023, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "username": f"user_{index}",
+            "email": f"user.{index}@example.com",
+            "full_name": f"User Number {index}",
+            "is_active": index % 7 != 0,
+            "signup_ts": signup + timedelta(minutes=index),
+            "roles": ["user", "editor"] if index % 3 else ["user"],
+        }
+        for index in range(count)
+    ]
+
+
+def timed(render, runs: int) -> list[float]:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        render()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    documents = make_documents(args.users)
+    users = [UserResponse.model_validate(document) for document in documents]
+
+    cases = {
+        # What an endpoint without a response model used to pay for raw documents
+        "json documents": lambda: JSONResponse(jsonable_encoder(documents, custom_encoder={ObjectId: str})),
+        "orjson documents": lambda: FastJSONResponse(documents),
+        # Same comparison for the validated UserResponse list
+        "json users": lambda: JSONResponse(jsonable_encoder(users)),
+        "orjson users": lambda: FastJSONResponse([user.model_dump() for user in users]),
+        "pydantic users": lambda: UserResponses.dump_json(users),
+        # Validation plus serialization, starting from the documents
+        "json validate": lambda: JSONResponse(jsonable_encoder(
+            [UserResponse.model_validate(document) for document in documents])),
+        "each validate": lambda: UserResponses.dump_json(
+            [UserResponse.model_validate(document) for document in documents]),
+        "list validate": lambda: UserRecords.dump_json(UserRecords.validate_python(documents)),
+    }
+
+    if orjson is None:
+        print("orjson is not installed; FastJSONResponse falls back to json")
+    baseline = None
+    for name, render in cases.items():
+        median = statistics.median(timed(render, args.runs))
+        if name.startswith("json "):
+            baseline = median
+        print(f"{name:>17}: median {median:8.1f} ms  ({baseline / median:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
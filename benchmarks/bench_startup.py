@@ -0,0 +1,57 @@
+"""
+Measure cold-start latency: the time it takes a fresh interpreter to import
+``app`` and the time until the first request has been answered.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10]
+
+MONGODB_URL defaults to an unreachable local address, so any database I/O
+done during import or start-up shows up as a server-selection stall.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    client.get("/")
+    answered = time.perf_counter()
+print(json.dumps({"import": imported - started, "first_request": answered - started}))
+"""
+
+
+def run_once(env: dict[str, str]) -> dict[str, float]:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("MONGODB_URL", "mongodb://localhost:1/?serverSelectionTimeoutMS=30000")
+
+    samples = [run_once(env) for _ in range(args.runs)]
+    for key in ("import", "first_request"):
+        values = [sample[key] * 1000 for sample in samples]
+        print(f"{key:>14}: median {statistics.median(values):8.1f} ms  "
+              f"min {min(values):8.1f} ms  max {max(values):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
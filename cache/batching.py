@@ -0,0 +1,96 @@
+import asyncio
+from typing import Annotated, Any, Awaitable, Callable, Generic, Hashable, Optional, Sequence, TypeVar
+from fastapi import Depends, Request
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class BatchLoader(Generic[K, V]):
+    """
+    Gather loads of single keys into one call for many keys.
+
+    The first key waits up to ``window_seconds`` for others to join it, then
+    ``load_many`` runs once for every key gathered so far; reaching
+    ``max_keys`` sends the batch at once. ``load_many`` returns a value for
+    each key, which is handed back to the callers waiting for it.
+    """
+
+    def __init__(self, load_many: Callable[[Sequence[K]], Awaitable[dict[K, V]]],
+                 window_seconds: float, max_keys: int):
+        self.load_many = load_many
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._pending: dict[K, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: set[asyncio.Task] = set()
+        self.loads = 0
+        self.batches = 0
+        self.keys = 0
+        self.full_batches = 0
+        self.largest_batch = 0
+
+    async def load(self, key: K) -> V:
+        self.loads += 1
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            # Mark a failure as retrieved even if every caller went away
+            future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._pending[key] = future
+            if len(self._pending) >= self.max_keys:
+                self.full_batches += 1
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.window_seconds, self._dispatch)
+        return await asyncio.shield(future)
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        self.batches += 1
+        self.keys += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        task = asyncio.create_task(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: dict[K, asyncio.Future]) -> None:
+        try:
+            values = await self.load_many(list(batch))
+        except Exception as err:
+            for future in batch.values():
+                future.set_exception(err)
+            return
+        for key, future in batch.items():
+            if key in values:
+                future.set_result(values[key])
+            else:
+                future.set_exception(KeyError(key))
+
+    async def close(self) -> None:
+        """Send the batch being gathered and wait for every batch in flight"""
+        self._dispatch()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "loads": self.loads,
+            "batches": self.batches,
+            "keys": self.keys,
+            "full_batches": self.full_batches,
+            "largest_batch": self.largest_batch,
+            "average_batch": self.keys / self.batches if self.batches else 0.0,
+        }
+
+
+def get_user_loader(request: Request) -> Optional[BatchLoader]:
+    return request.app.state.user_loader
+
+
+UserLoaderDep = Annotated[Optional[BatchLoader], Depends(get_user_loader)]
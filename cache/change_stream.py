@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Mapping, Optional
+from pymongo.errors import OperationFailure
+from cache.users import UserCache
+
+logger = logging.getLogger(__name__)
+
+
+class UserChangeStreamInvalidator:
+    """
+    Tails the change stream of ``users`` and drops cached reads of every user
+    it reports, so writes made outside this API do not leave stale entries.
+
+    The resume token is stored in ``state_collection`` under ``consumer``, so
+    a restarted worker picks up where the stream left off.
+    """
+    # Collection-wide events after which no cached entry can be trusted
+    FLUSH_OPERATIONS = {"drop", "rename", "dropDatabase", "invalidate"}
+    # Server error code when the resume token is no longer in the oplog
+    CHANGE_STREAM_HISTORY_LOST = 286
+    MAX_AWAIT_TIME_MS = 1000
+    SAVE_INTERVAL_SECONDS = 1.0
+    RETRY_DELAY_SECONDS = 5.0
+
+    def __init__(self, collection: Any, state_collection: Any, cache: UserCache, consumer: str):
+        self.collection = collection
+        self.state_collection = state_collection
+        self.cache = cache
+        self.consumer = consumer
+        self.task: Optional[asyncio.Task] = None
+        self.resume_token: Optional[Mapping[str, Any]] = None
+        self.saved_at = 0.0
+        self.events = 0
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.save_resume_token(force=True)
+
+    async def run(self) -> None:
+        token_loaded = False
+        while True:
+            try:
+                if not token_loaded:
+                    state = await self.state_collection.find_one({"_id": self.consumer})
+                    self.resume_token = state["resume_token"] if state else None
+                    token_loaded = True
+                await self.follow()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as err:
+                if err.code != self.CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Users change stream failed: %s", err)
+                    await asyncio.sleep(self.RETRY_DELAY_SECONDS)
+                    continue
+                logger.warning("Users change stream cannot resume, starting over: %s", err)
+                self.resume_token = None
+            except Exception as err:
+                logger.warning("Users change stream failed: %s", err)
+                await asyncio.sleep(self.RETRY_DELAY_SECONDS)
+
+    async def follow(self) -> None:
+        """Apply events until the stream closes, e.g. after an ``invalidate`` event"""
+        stream = await self.collection.watch(
+            full_document="updateLookup",
+            full_document_before_change="whenAvailable",
+            resume_after=self.resume_token,
+            max_await_time_ms=self.MAX_AWAIT_TIME_MS,
+        )
+        try:
+            if self.resume_token is None:
+                # Nothing says what changed before the stream opened, so do not trust the cache
+                await self.cache.invalidate_all(publish=False)
+            while stream.alive:
+                change = await stream.try_next()
+                if change is not None:
+                    await self.handle(change)
+                    self.events += 1
+                    if change["operationType"] == "invalidate":
+                        # A stream cannot resume after its invalidate event, so the next one starts from now
+                        self.resume_token = None
+                        await self.state_collection.delete_one({"_id": self.consumer})
+                        return
+                # The token also advances on empty batches, so save it either way
+                self.resume_token = stream.resume_token
+                await self.save_resume_token()
+        finally:
+            await stream.close()
+
+    async def handle(self, change: Mapping[str, Any]) -> None:
+        operation = change["operationType"]
+        if operation in self.FLUSH_OPERATIONS:
+            await self.cache.invalidate_all(publish=False)
+            return
+
+        before = change.get("fullDocumentBeforeChange")
+        after = change.get("fullDocument")
+        users = [(image["email"], image.get("username")) for image in (before, after)
+                 if image is not None and "email" in image]
+        # Cached lookups are also tagged by _id, so deletes and email changes
+        # are evicted precisely even without a pre-image
+        ids = [change["documentKey"]["_id"]] if "documentKey" in change else []
+        await self.cache.invalidate_users(users, ids=ids, publish=False)
+
+    async def save_resume_token(self, force: bool = False) -> None:
+        if self.resume_token is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.saved_at < self.SAVE_INTERVAL_SECONDS:
+            return
+        self.saved_at = now
+        await self.state_collection.update_one(
+            {"_id": self.consumer},
+            {"$set": {"resume_token": self.resume_token, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    def metrics(self) -> dict[str, Any]:
+        return {"consumer": self.consumer, "events": self.events,
+                "running": self.task is not None and not self.task.done()}
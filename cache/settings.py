@@ -0,0 +1,29 @@
+from typing import ClassVar, Optional
+from pydantic import Field
+from database.settings import EnvSettings
+
+
+class CacheSettings(EnvSettings):
+    """User lookup cache settings, read from ``USER_CACHE_*`` environment variables"""
+    ENV_PREFIX: ClassVar[str] = "USER_CACHE_"
+
+    enabled: bool = Field(default=True, description="Cache GET /users/{search} results in each worker")
+    max_size: int = Field(default=10000, ge=0, description="Lookups kept per worker before evicting the oldest")
+    ttl_seconds: float = Field(default=30.0, gt=0, description="How long a cached lookup stays valid")
+    redis_url: Optional[str] = Field(default=None,
+                                     description="Redis-protocol server shared by all workers, e.g. redis://localhost:6379/0")
+    redis_prefix: str = Field(default="users-cache", description="Prefix of every key and channel in the shared cache")
+    change_stream: bool = Field(default=False,
+                                description="Tail the users change stream to drop entries changed outside this API")
+    change_stream_consumer: str = Field(default="user-cache",
+                                        description="Name the change stream resume token is stored under")
+
+
+class LookupSettings(EnvSettings):
+    """User lookup batching settings, read from ``USER_LOOKUP_*`` environment variables"""
+    ENV_PREFIX: ClassVar[str] = "USER_LOOKUP_"
+
+    batch: bool = Field(default=False,
+                        description="Gather concurrent GET /users/{search} reads into one $in query")
+    batch_window_ms: float = Field(default=2.0, gt=0, description="How long a batch waits for more lookups")
+    batch_max_keys: int = Field(default=100, ge=1, description="Lookups that send a batch without waiting")
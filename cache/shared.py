@@ -0,0 +1,136 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Iterable, Optional
+
+
+class SharedCache(ABC):
+    """Cache tier shared by every worker and host, holding pre-serialized responses"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl_seconds: float, tags: Iterable[str] = (),
+                  generation: Optional[int] = None) -> bool:
+        """
+        Store ``value`` under ``key``; with ``generation``, only while the
+        write generation still has that value. Returns whether it was stored.
+        """
+
+    @abstractmethod
+    async def invalidate(self, keys: Iterable[str] = (), tags: Iterable[str] = ()) -> None:
+        """Drop ``keys`` and every entry stored with one of ``tags``"""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """Drop every entry"""
+
+    @abstractmethod
+    async def generation(self) -> int:
+        """Counter bumped on every write, for entries that any write makes stale"""
+
+    @abstractmethod
+    async def bump_generation(self) -> int:
+        ...
+
+    @abstractmethod
+    async def publish(self, message: dict[str, Any]) -> None:
+        """Tell every subscribed worker about a write"""
+
+    @abstractmethod
+    def subscribe(self) -> AsyncIterator[dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def close(self) -> None:
+        ...
+
+
+class RedisCache(SharedCache):
+    """SharedCache on any server speaking the Redis protocol"""
+
+    def __init__(self, client: Any, prefix: str):
+        self.redis = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str) -> "RedisCache":
+        try:
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("A shared cache URL is configured but the redis package is not installed")
+        return cls(redis.asyncio.from_url(url), prefix)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def _tag(self, tag: str) -> str:
+        return f"{self.prefix}:tag:{tag}"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.redis.get(self._key(key))
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float, tags: Iterable[str] = (),
+                  generation: Optional[int] = None) -> bool:
+        # Imported here like redis.asyncio, since redis is an optional dependency
+        from redis.exceptions import WatchError
+        async with self.redis.pipeline(transaction=generation is not None) as pipeline:
+            if generation is not None:
+                # Optimistic lock: a write bumping the generation before EXEC aborts the set
+                await pipeline.watch(self._key("generation"))
+                if int(await pipeline.get(self._key("generation")) or 0) != generation:
+                    return False
+                pipeline.multi()
+            ttl_ms = int(ttl_seconds * 1000)
+            pipeline.set(self._key(key), value, px=ttl_ms)
+            for tag in tags:
+                # A tag set lives as long as the newest entry it points to
+                pipeline.sadd(self._tag(tag), self._key(key))
+                pipeline.pexpire(self._tag(tag), ttl_ms)
+            try:
+                await pipeline.execute()
+            except WatchError:
+                return False
+        return True
+
+    async def invalidate(self, keys: Iterable[str] = (), tags: Iterable[str] = ()) -> None:
+        tag_keys = [self._tag(tag) for tag in tags]
+        doomed = [self._key(key) for key in keys] + tag_keys
+        if tag_keys:
+            pipeline = self.redis.pipeline(transaction=False)
+            for tag_key in tag_keys:
+                pipeline.smembers(tag_key)
+            for members in await pipeline.execute():
+                doomed.extend(members)
+        if doomed:
+            await self.redis.delete(*doomed)
+
+    async def clear(self) -> None:
+        # The generation counter survives, so pages cached later never reuse an old key
+        generation = self._key("generation")
+        async for key in self.redis.scan_iter(match=self._key("*"), count=1000):
+            if key.decode() != generation:
+                await self.redis.delete(key)
+
+    async def generation(self) -> int:
+        return int(await self.redis.get(self._key("generation")) or 0)
+
+    async def bump_generation(self) -> int:
+        return await self.redis.incr(self._key("generation"))
+
+    async def publish(self, message: dict[str, Any]) -> None:
+        await self.redis.publish(self._key("invalidations"), json.dumps(message))
+
+    async def subscribe(self) -> AsyncIterator[dict[str, Any]]:
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self._key("invalidations"))
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield json.loads(message["data"])
+        finally:
+            await pubsub.aclose()
+
+    async def close(self) -> None:
+        await self.redis.aclose()
@@ -0,0 +1,56 @@
+import asyncio
+from typing import Annotated, Any, Awaitable, Callable, Hashable, TypeVar
+from fastapi import Depends, Request
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one.
+
+    The first caller for a key starts the call; callers arriving while it is
+    in flight wait for the same result, or exception, instead of repeating
+    it. The call runs in its own task, so a caller that goes away does not
+    cancel it for the others.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            self.executed += 1
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            task.exception()
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
+
+
+def get_user_lookups(request: Request) -> SingleFlight:
+    return request.app.state.user_lookups
+
+
+UserLookupsDep = Annotated[SingleFlight, Depends(get_user_lookups)]
@@ -0,0 +1,308 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Annotated, Any, Iterable, NamedTuple, Optional
+from fastapi import Depends, Request
+from cache.etag import make_etag
+from cache.memory import MemoryCache
+from cache.settings import CacheSettings
+from cache.shared import RedisCache, SharedCache
+from repositories.users import UserDocument
+from schema.user import UserRecords
+
+logger = logging.getLogger(__name__)
+
+
+class CachedBody(NamedTuple):
+    """
+    A serialized JSON response with its ETag, the tags it is cached under
+    and, for listing pages, the next-page cursor
+    """
+    body: bytes
+    etag: str
+    next_cursor: Optional[str] = None
+    tags: tuple[str, ...] = ()
+
+    @classmethod
+    def of(cls, body: bytes, next_cursor: Optional[str] = None, tags: Iterable[str] = ()) -> "CachedBody":
+        return cls(body, make_etag(body), next_cursor, tuple(tags))
+
+    def encode(self) -> bytes:
+        return f"{self.next_cursor or ''}\n{self.etag}\n{json.dumps(self.tags)}\n".encode() + self.body
+
+    @classmethod
+    def decode(cls, value: bytes) -> "CachedBody":
+        next_cursor, etag, tags, body = value.split(b"\n", 3)
+        return cls(body, etag.decode(), next_cursor.decode() or None, tuple(json.loads(tags)))
+
+
+class LookupGeneration(NamedTuple):
+    """Write generations of both tiers, taken before a lookup is read"""
+    local: int
+    shared: Optional[int] = None
+
+
+class UserCache:
+    """
+    Cache of user reads in two tiers.
+
+    Entries are serialized responses with their ETag. The in-process tier
+    keeps GET /users/{search} results. The optional shared tier keeps those
+    and listing pages for every worker, and carries invalidations between
+    workers.
+    """
+    # Past this many users, one "drop everything" message replaces per-user ones
+    PUBLISH_ALL_THRESHOLD = 100
+
+    def __init__(self, settings: CacheSettings, shared: Optional[SharedCache] = None):
+        self.settings = settings
+        self.memory = MemoryCache(settings.max_size if settings.enabled else 0, settings.ttl_seconds)
+        self.shared = shared
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.shared_errors = 0
+        # After a failed shared invalidation the shared tier may hold stale entries,
+        # so it is bypassed until they have expired
+        self.shared_bypass_until = 0.0
+        # Bumped by every in-process invalidation, so fills that raced one can be dropped
+        self.generation = 0
+        self.subscriber: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_settings(cls, settings: CacheSettings) -> "UserCache":
+        shared = None
+        if settings.enabled and settings.redis_url:
+            shared = RedisCache.from_url(settings.redis_url, settings.redis_prefix)
+        return cls(settings, shared)
+
+    def start(self) -> None:
+        """Apply invalidations published by other workers to the in-process tier"""
+        if self.shared is not None:
+            self.subscriber = asyncio.create_task(self._follow_invalidations())
+
+    async def close(self) -> None:
+        if self.subscriber is not None:
+            self.subscriber.cancel()
+            self.subscriber = None
+        if self.shared is not None:
+            await self.shared.close()
+
+    async def _follow_invalidations(self) -> None:
+        while True:
+            try:
+                async for message in self.shared.subscribe():
+                    if message.get("all"):
+                        self._clear_local()
+                    elif "tags" in message:
+                        self._invalidate_local_tags(message["tags"])
+                    else:
+                        self._invalidate_local(message["email"], message.get("username"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.warning("Lost the shared cache invalidation channel: %s", err)
+                # Entries may have been missed, so start over from an empty cache
+                self._clear_local()
+                await asyncio.sleep(1)
+
+    def _shared_available(self) -> bool:
+        return self.shared is not None and time.monotonic() >= self.shared_bypass_until
+
+    def _shared_failed(self, operation: str, err: Exception) -> None:
+        # The shared tier only saves work, so its errors never fail a request
+        self.shared_errors += 1
+        logger.warning("Shared cache %s failed: %s", operation, err)
+
+    def _distrust_shared(self) -> None:
+        """Clear this worker and bypass the shared tier until entries it may have kept have expired"""
+        self._clear_local()
+        self.shared_bypass_until = time.monotonic() + self.settings.ttl_seconds
+
+    async def get(self, search: str) -> Optional[CachedBody]:
+        """The cached lookup, from the in-process tier or else from the shared one"""
+        if not self.settings.enabled:
+            return None
+        cached = self.memory.get(search)
+        if cached is not None:
+            return cached
+        generation = self.generation
+        value = await self._shared_get(f"lookup:{search}")
+        if value is None:
+            return None
+        cached = CachedBody.decode(value)
+        if self.generation == generation:
+            self.memory.set(search, cached, tags=cached.tags)
+        return cached
+
+    async def lookup_generation(self) -> LookupGeneration:
+        """
+        Generations to pass to ``set`` for a lookup about to be read.
+
+        Take them before reading the database. If a write in any worker
+        invalidates anything while the read is in flight, ``set`` does not
+        cache its result, which may predate the write.
+        """
+        shared = None
+        if self._shared_available():
+            try:
+                shared = await self.shared.generation()
+            except Exception as err:
+                # Without a generation the fill cannot be guarded, so set() skips it
+                self._shared_failed("read", err)
+        return LookupGeneration(self.generation, shared)
+
+    @staticmethod
+    def id_tag(user_id: Any) -> str:
+        return f"id:{user_id}"
+
+    async def set(self, search: str, users: list[UserDocument], generation: LookupGeneration) -> CachedBody:
+        """Validate and serialize ``users`` once and cache the result in both tiers"""
+        records = UserRecords.validate_python(users)
+        # Tag by email so a write to a user drops every lookup that returned it, and
+        # by _id so a change stream event can find them without the old email
+        tags = [user["email"] for user in records] + [self.id_tag(user["_id"]) for user in users if "_id" in user]
+        cached = CachedBody.of(UserRecords.dump_json(records), tags=tags)
+        if not self.settings.enabled or self.generation != generation.local:
+            return cached
+        if self.shared is not None:
+            if generation.shared is None:
+                # The shared tier is down or bypassed, so invalidations from other workers may not arrive
+                return cached
+            try:
+                stored = await self.shared.set(f"lookup:{search}", cached.encode(), self.settings.ttl_seconds,
+                                               tags=cached.tags, generation=generation.shared)
+            except Exception as err:
+                self._shared_failed("write", err)
+            else:
+                if not stored:
+                    return cached
+            if self.generation != generation.local:
+                return cached
+        self.memory.set(search, cached, tags=cached.tags)
+        return cached
+
+    async def page_key(self, page: str) -> Optional[str]:
+        """
+        Shared-tier key of a listing page for the current write generation.
+
+        Take the key before reading the database, so a page read while a
+        write lands is stored under the generation that write made stale.
+        """
+        if not self._shared_available():
+            return None
+        try:
+            return f"page:{await self.shared.generation()}:{page}"
+        except Exception as err:
+            self._shared_failed("read", err)
+            return None
+
+    async def get_page(self, key: str) -> Optional[CachedBody]:
+        value = await self._shared_get(key)
+        return CachedBody.decode(value) if value is not None else None
+
+    async def set_page(self, key: str, page: CachedBody) -> None:
+        try:
+            await self.shared.set(key, page.encode(), self.settings.ttl_seconds)
+        except Exception as err:
+            self._shared_failed("write", err)
+
+    async def _shared_get(self, key: str) -> Optional[bytes]:
+        if not self._shared_available():
+            return None
+        try:
+            value = await self.shared.get(key)
+        except Exception as err:
+            self._shared_failed("read", err)
+            return None
+        if value is None:
+            self.shared_misses += 1
+        else:
+            self.shared_hits += 1
+        return value
+
+    def _invalidate_local(self, email: str, username: Optional[str] = None) -> None:
+        self.generation += 1
+        self.memory.invalidate_tag(email)
+        self.memory.invalidate(email)
+        if username is not None:
+            self.memory.invalidate(username)
+
+    def _invalidate_local_tags(self, tags: list[str]) -> None:
+        if tags:
+            self.generation += 1
+        for tag in tags:
+            self.memory.invalidate_tag(tag)
+
+    async def invalidate_user(self, email: str, username: Optional[str] = None) -> None:
+        await self.invalidate_users([(email, username)])
+
+    async def invalidate_users(self, users: Iterable[tuple[str, Optional[str]]], ids: Iterable[Any] = (),
+                               publish: bool = True) -> None:
+        """
+        Drop every cached read of ``users``, and of the users with ``ids``,
+        from both tiers.
+
+        With ``publish`` the other workers are told to do the same; callers
+        that every worker runs for itself pass False.
+        """
+        users = list(users)
+        id_tags = [self.id_tag(user_id) for user_id in ids]
+        for email, username in users:
+            self._invalidate_local(email, username)
+        self._invalidate_local_tags(id_tags)
+        if self.shared is None or not (users or id_tags):
+            return
+        try:
+            await self._invalidate_shared(users, id_tags, publish)
+        except Exception as err:
+            self._shared_failed("invalidation", err)
+            self._distrust_shared()
+
+    async def _invalidate_shared(self, users: list[tuple[str, Optional[str]]], id_tags: list[str],
+                                 publish: bool) -> None:
+        keys = [f"lookup:{name}" for email, username in users for name in (email, username) if name]
+        # Bump first: any write can change any listing page, and a lookup
+        # read before this write is then either refused by set() or deleted here
+        await self.shared.bump_generation()
+        await self.shared.invalidate(keys=keys, tags=[email for email, _ in users] + id_tags)
+        if not publish:
+            return
+        if len(users) + len(id_tags) > self.PUBLISH_ALL_THRESHOLD:
+            await self.shared.publish({"all": True})
+            return
+        for email, username in users:
+            await self.shared.publish({"email": email, "username": username})
+        if id_tags:
+            await self.shared.publish({"tags": id_tags})
+
+    def _clear_local(self) -> None:
+        self.generation += 1
+        self.memory.clear()
+
+    async def invalidate_all(self, publish: bool = True) -> None:
+        self._clear_local()
+        if self.shared is None:
+            return
+        try:
+            await self.shared.bump_generation()
+            await self.shared.clear()
+            if publish:
+                await self.shared.publish({"all": True})
+        except Exception as err:
+            self._shared_failed("invalidation", err)
+            self._distrust_shared()
+
+    def metrics(self) -> dict[str, Any]:
+        metrics = {"enabled": self.settings.enabled, **self.memory.metrics()}
+        if self.shared is not None:
+            metrics["shared"] = {"hits": self.shared_hits, "misses": self.shared_misses, "errors": self.shared_errors,
+                                 "bypassed": not self._shared_available()}
+        return metrics
+
+
+def get_user_cache(request: Request) -> UserCache:
+    return request.app.state.user_cache
+
+
+UserCacheDep = Annotated[UserCache, Depends(get_user_cache)]
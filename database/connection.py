@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from typing import Optional, Union
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+from database.executor import DatabaseExecutor
+from database.offload import Offloaded
+from database.settings import DatabaseSettings
+
+logger = logging.getLogger(__name__)
+
+
+class MongoConnection:
+    """Owns the MongoClient for the lifetime of the application"""
+
+    def __init__(self, settings: DatabaseSettings):
+        self.settings = settings
+        self.client: Optional[Union[AsyncMongoClient, Offloaded]] = None
+        self.executor: Optional[DatabaseExecutor] = None
+        self.warmup_task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        if self.settings.driver == "threaded":
+            self.executor = DatabaseExecutor(self.settings.executor_workers)
+            client = MongoClient(self.settings.url, **self.settings.client_options())
+            self.client = Offloaded(client, self.executor)
+        else:
+            self.client = AsyncMongoClient(self.settings.url, **self.settings.client_options())
+        await self.prewarm()
+
+    async def prewarm(self) -> None:
+        """Open up to ``min_pool_size`` connections before the app starts serving"""
+        if self.settings.min_pool_size == 0:
+            return
+        # Concurrent pings each check out their own connection, which fills the pool
+        await asyncio.gather(*(
+            self.db.command("ping")
+            for _ in range(self.settings.min_pool_size)
+        ))
+
+    def start_warmup(self) -> None:
+        """Run the warm-up probe in the background so it never delays readiness"""
+        if self.settings.warmup:
+            self.warmup_task = asyncio.create_task(self.warmup())
+
+    async def warmup(self) -> None:
+        """Select a server and open a first connection, bounded by ``warmup_timeout_ms``"""
+        try:
+            collections = await asyncio.wait_for(
+                self.db.list_collection_names(),
+                timeout=self.settings.warmup_timeout_ms / 1000,
+            )
+            logger.info("MongoDB warm-up done, collections: %s", collections)
+        except asyncio.TimeoutError:
+            logger.warning("MongoDB warm-up timed out after %d ms", self.settings.warmup_timeout_ms)
+        except Exception as err:
+            logger.warning("MongoDB warm-up failed: %s", err)
+
+    async def close(self) -> None:
+        if self.warmup_task is not None:
+            self.warmup_task.cancel()
+            self.warmup_task = None
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    @property
+    def db(self) -> Union[AsyncDatabase, Offloaded]:
+        if self.client is None:
+            raise RuntimeError("MongoDB client is not connected")
+        return self.client.get_database(self.settings.database)
+
+    def get_collection(self, name: str) -> Union[AsyncCollection, Offloaded]:
+        return self.db.get_collection(name)
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class DatabaseExecutor:
+    """Bounded thread pool that runs synchronous PyMongo calls off the event loop"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mongo")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run ``func`` on a pool thread and await its result"""
+        enqueued = time.perf_counter()
+
+        def call() -> T:
+            waited = time.perf_counter() - enqueued
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        with self._lock:
+            self.queued += 1
+        future = self._executor.submit(call)
+        future.add_done_callback(self._forget_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def _forget_cancelled(self, future: Future) -> None:
+        # A call cancelled before it started never decrements the queue itself
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            started = self.completed + self.active
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queued,
+                "active_workers": self.active,
+                "completed": self.completed,
+                "wait_time_avg_ms": self.wait_time_total / started * 1000 if started else 0.0,
+                "wait_time_max_ms": self.wait_time_max * 1000,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+from typing import Any, Optional
+from pymongo import IndexModel
+
+logger = logging.getLogger(__name__)
+
+
+class IndexManager:
+    """Declares the indexes a collection needs, builds them and reports drift"""
+    # Keys that describe the index itself rather than an option of it
+    NON_OPTION_KEYS = {"key", "name", "v", "ns"}
+
+    def __init__(self, collection: Any, indexes: list[IndexModel]):
+        self.collection = collection
+        self.indexes = indexes
+        self.task: Optional[asyncio.Task] = None
+        self.error: Optional[str] = None
+
+    def start(self) -> None:
+        """Build the declared indexes in the background so readiness never waits on them"""
+        self.task = asyncio.create_task(self.ensure())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def ensure(self) -> None:
+        try:
+            names = await self.collection.create_indexes(self.indexes)
+            self.error = None
+            logger.info("Indexes on %s are in place: %s", self.collection.name, names)
+        except Exception as err:
+            # Typically existing duplicates preventing a unique index from being built
+            self.error = str(err)
+            logger.error("Building indexes on %s failed: %s", self.collection.name, err)
+            return
+
+        report = await self.drift()
+        if report["missing"] or report["changed"] or report["undeclared"]:
+            logger.warning("Index drift on %s: %s", self.collection.name, report)
+
+    async def drift(self) -> dict[str, Any]:
+        """Compare the declared indexes with the ones present on the collection"""
+        actual = await self.collection.index_information()
+        actual.pop("_id_", None)
+
+        missing, changed = [], []
+        for index in self.indexes:
+            declared = index.document
+            name = declared["name"]
+            if name not in actual:
+                missing.append(name)
+            elif self._describe(declared) != self._describe(actual[name]):
+                changed.append(name)
+
+        declared_names = {index.document["name"] for index in self.indexes}
+        return {
+            "missing": missing,
+            "changed": changed,
+            "undeclared": sorted(set(actual) - declared_names),
+            "error": self.error,
+        }
+
+    @classmethod
+    def _describe(cls, spec: dict[str, Any]) -> tuple:
+        keys = tuple((field, direction) for field, direction in dict(spec["key"]).items())
+        options = {key: value for key, value in spec.items() if key not in cls.NON_OPTION_KEYS}
+        return keys, sorted(options.items())
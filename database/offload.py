@@ -0,0 +1,104 @@
+import itertools
+from collections import deque
+from typing import Any, Optional
+from database.executor import DatabaseExecutor
+
+
+class OffloadedCursor:
+    """Async iteration over a synchronous PyMongo cursor, one chunk per executor call"""
+    DEFAULT_CHUNK_SIZE = 101
+
+    def __init__(self, cursor: Any, executor: DatabaseExecutor, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._cursor = cursor
+        self._executor = executor
+        self._chunk_size = chunk_size
+        self._buffer: deque = deque()
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def chain(*args: Any, **kwargs: Any) -> Any:
+            # sort(), limit(), batch_size() ... only configure the cursor and return it
+            result = attr(*args, **kwargs)
+            return self if result is self._cursor else result
+        return chain
+
+    def batch_size(self, batch_size: int) -> "OffloadedCursor":
+        self._cursor.batch_size(batch_size)
+        self._chunk_size = batch_size or self.DEFAULT_CHUNK_SIZE
+        return self
+
+    def __aiter__(self) -> "OffloadedCursor":
+        return self
+
+    async def __anext__(self) -> Any:
+        if not self._buffer:
+            self._buffer.extend(await self._executor.run(self._next_chunk))
+            if not self._buffer:
+                raise StopAsyncIteration
+        return self._buffer.popleft()
+
+    async def try_next(self) -> Any:
+        """The next document, or None if none is ready; change streams wait up to max_await_time_ms"""
+        if self._buffer:
+            return self._buffer.popleft()
+        return await self._executor.run(self._cursor.try_next)
+
+    def _next_chunk(self) -> list:
+        return list(itertools.islice(self._cursor, self._chunk_size))
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        documents = list(self._buffer)
+        self._buffer.clear()
+        remaining = None if length is None else max(length - len(documents), 0)
+        documents.extend(await self._executor.run(
+            lambda: list(itertools.islice(self._cursor, remaining))))
+        return documents
+
+    async def close(self) -> None:
+        await self._executor.run(self._cursor.close)
+
+
+class Offloaded:
+    """
+    Async facade over a synchronous PyMongo client, database or collection.
+
+    Every method that may do I/O runs on the DatabaseExecutor, so code written
+    against the async driver works unchanged on top of the sync one.
+    """
+    # Methods that only build another handle and never touch the network
+    HANDLE_FACTORIES = {"get_database", "get_collection", "with_options"}
+    # Methods that build a cursor lazily; iterating it is what does the I/O
+    CURSOR_FACTORIES = {"find"}
+    # Methods that run a command to open their cursor
+    COMMAND_CURSOR_FACTORIES = {"aggregate", "list_indexes", "list_collections"}
+
+    def __init__(self, target: Any, executor: DatabaseExecutor):
+        self._target = target
+        self._executor = executor
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        if name in self.HANDLE_FACTORIES:
+            return lambda *args, **kwargs: Offloaded(attr(*args, **kwargs), self._executor)
+
+        if name in self.CURSOR_FACTORIES:
+            return lambda *args, **kwargs: OffloadedCursor(attr(*args, **kwargs), self._executor)
+
+        if name in self.COMMAND_CURSOR_FACTORIES or name == "watch":
+            # Change streams must hand out events one at a time rather than wait for a full chunk
+            chunk_size = 1 if name == "watch" else OffloadedCursor.DEFAULT_CHUNK_SIZE
+
+            async def open_cursor(*args: Any, **kwargs: Any) -> OffloadedCursor:
+                cursor = await self._executor.run(attr, *args, **kwargs)
+                return OffloadedCursor(cursor, self._executor, chunk_size)
+            return open_cursor
+
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            return await self._executor.run(attr, *args, **kwargs)
+        return call
@@ -0,0 +1,55 @@
+import os
+from typing import Any, ClassVar, Literal, Optional
+from pydantic import BaseModel, Field
+
+
+class EnvSettings(BaseModel):
+    """Settings read from environment variables named ``ENV_PREFIX`` + field name"""
+    ENV_PREFIX: ClassVar[str] = ""
+
+    @classmethod
+    def from_env(cls, environ: Optional[dict[str, str]] = None):
+        environ = os.environ if environ is None else environ
+        values = {
+            name: environ[cls.ENV_PREFIX + name.upper()]
+            for name in cls.model_fields
+            if cls.ENV_PREFIX + name.upper() in environ
+        }
+        return cls(**values)
+
+
+class DatabaseSettings(EnvSettings):
+    """MongoDB connection settings, read from ``MONGODB_*`` environment variables"""
+    ENV_PREFIX: ClassVar[str] = "MONGODB_"
+
+    url: str = Field(..., description="MongoDB connection string")
+    database: str = Field(default="fastapi-mongodb", description="Database used by the application")
+    max_pool_size: int = Field(default=100, ge=0, description="Upper bound of connections per server")
+    min_pool_size: int = Field(default=0, ge=0, description="Connections kept open and pre-warmed at start-up")
+    max_idle_time_ms: Optional[int] = Field(default=None, ge=0,
+                                            description="Close pooled connections idle for longer than this")
+    wait_queue_timeout_ms: Optional[int] = Field(default=None, ge=0,
+                                                 description="How long a request waits for a free connection")
+    connect_timeout_ms: Optional[int] = Field(default=None, ge=0,
+                                              description="Timeout for opening a new connection")
+    server_selection_timeout_ms: Optional[int] = Field(default=None, ge=0,
+                                                       description="How long to wait for a suitable server")
+    driver: Literal["async", "threaded"] = Field(
+        default="async",
+        description="'async' uses AsyncMongoClient, 'threaded' runs the sync MongoClient on a thread pool")
+    executor_workers: int = Field(default=16, ge=1,
+                                  description="Thread pool size when driver is 'threaded'")
+    warmup: bool = Field(default=False, description="Probe the server in the background after start-up")
+    warmup_timeout_ms: int = Field(default=5000, ge=0, description="Upper bound for the warm-up probe")
+
+    def client_options(self) -> dict[str, Any]:
+        """Keyword arguments for the MongoClient constructor"""
+        options = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "maxIdleTimeMS": self.max_idle_time_ms,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+        }
+        return {key: value for key, value in options.items() if value is not None}
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Annotated, Any, Optional
+from bson import ObjectId
+from fastapi import Depends, Request
+from repositories.jobs import JobsRepository
+from repositories.users import UserDocument, UsersRepository
+from schema.exports import ExportFormat, ExportJobStatus, ExportLimits, ExportPartitionStatus
+from schema.user import UserRecordAdapter, UserRecords
+
+logger = logging.getLogger(__name__)
+
+# [lower, upper) _id range of one partition; None leaves that side open
+Partition = tuple[Optional[ObjectId], Optional[ObjectId]]
+
+
+class NdjsonShardWriter:
+    """Writes users to one NDJSON file, one user per line"""
+    EXTENSION = "ndjson"
+
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+
+    def write(self, users: list[UserDocument]) -> None:
+        records = UserRecords.validate_python(users)
+        self.file.write(b"".join(UserRecordAdapter.dump_json(record) + b"\n" for record in records))
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetShardWriter:
+    """Writes users to one Parquet file, one row group per batch; needs pyarrow"""
+    EXTENSION = "parquet"
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet exports need the pyarrow package")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([
+            ("username", pyarrow.string()),
+            ("email", pyarrow.string()),
+            ("full_name", pyarrow.string()),
+            ("roles", pyarrow.list_(pyarrow.string())),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, users: list[UserDocument]) -> None:
+        records = UserRecords.validate_python(users)
+        self.writer.write_table(self.pyarrow.Table.from_pylist(records, schema=self.schema))
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+SHARD_WRITERS = {"ndjson": NdjsonShardWriter, "parquet": ParquetShardWriter}
+
+
+async def split_into_partitions(repository: UsersRepository, partitions: int) -> list[Partition]:
+    """
+    Split the collection into about ``partitions`` ``_id`` ranges of similar size.
+
+    Boundaries are quantiles of a random ``$sample`` of ids, so no range
+    depends on how the ids were generated. Small collections get fewer
+    ranges, and an empty one gets a single open range.
+    """
+    sample = sorted(await repository.sample_ids(partitions * ExportLimits.SAMPLES_PER_PARTITION))
+    boundaries = sorted({sample[len(sample) * index // partitions] for index in range(1, partitions)}) if sample else []
+    edges = [None, *boundaries, None]
+    return list(zip(edges, edges[1:]))
+
+
+class UserExportJob:
+    """
+    Export every user to sharded files, one per ``_id`` range.
+
+    Each range is read by its own cursor, and all ranges are read
+    concurrently. Batches are serialized and written off the event loop.
+    The status is saved at most every ``SAVE_INTERVAL_SECONDS`` while
+    batches are written, and once more when the export ends.
+    """
+    SAVE_INTERVAL_SECONDS = 1.0
+
+    def __init__(self, status: ExportJobStatus, partitions: int, jobs: JobsRepository):
+        self.status = status
+        self.partitions = partitions
+        self.jobs = jobs
+        self.task: Optional[asyncio.Task] = None
+        # Ranges save concurrently; one at a time keeps an older status from landing last
+        self.saving = asyncio.Lock()
+        self.saved_at = 0.0
+
+    async def _save(self) -> None:
+        async with self.saving:
+            self.saved_at = time.monotonic()
+            self.status.updated_at = datetime.now(timezone.utc)
+            await self.jobs.save(self.status)
+
+    async def run(self, repository: UsersRepository) -> None:
+        self.status.state = "running"
+        try:
+            await self._save()
+            await asyncio.to_thread(os.makedirs, self.status.directory, exist_ok=True)
+            ranges = await split_into_partitions(repository, self.partitions)
+            extension = SHARD_WRITERS[self.status.format].EXTENSION
+            self.status.partitions = [
+                ExportPartitionStatus(
+                    file=f"users-{index:05d}-of-{len(ranges):05d}.{extension}",
+                    lower=str(lower) if lower is not None else None,
+                    upper=str(upper) if upper is not None else None,
+                )
+                for index, (lower, upper) in enumerate(ranges)
+            ]
+            tasks = [
+                asyncio.create_task(self._export_range(repository, lower, upper, partition))
+                for (lower, upper), partition in zip(ranges, self.status.partitions)
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # One range failing fails the export, so stop reading the others
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            self.status.state = "succeeded"
+        except asyncio.CancelledError:
+            self.status.state = "failed"
+            self.status.error = "Cancelled"
+            raise
+        except Exception as err:
+            logger.exception("User export %s failed", self.status.id)
+            self.status.state = "failed"
+            self.status.error = str(err)
+        finally:
+            self.status.finished_at = datetime.now(timezone.utc)
+            try:
+                await self._save()
+            except Exception:
+                logger.exception("Could not save the final status of user export %s", self.status.id)
+
+    async def _export_range(self, repository: UsersRepository, lower: Optional[ObjectId],
+                            upper: Optional[ObjectId], partition: ExportPartitionStatus) -> None:
+        path = os.path.join(self.status.directory, partition.file)
+        writer = await asyncio.to_thread(SHARD_WRITERS[self.status.format], path)
+        try:
+            batch: list[UserDocument] = []
+            async for user in repository.iterate_range(lower, upper):
+                batch.append(user)
+                if len(batch) >= ExportLimits.WRITE_BATCH_SIZE:
+                    await self._write(writer, batch, partition)
+                    batch = []
+            if batch:
+                await self._write(writer, batch, partition)
+        finally:
+            await asyncio.to_thread(writer.close)
+        partition.done = True
+
+    async def _write(self, writer: Any, batch: list[UserDocument], partition: ExportPartitionStatus) -> None:
+        await asyncio.to_thread(writer.write, batch)
+        partition.documents += len(batch)
+        self.status.documents += len(batch)
+        if time.monotonic() - self.saved_at >= self.SAVE_INTERVAL_SECONDS:
+            await self._save()
+
+
+class UserExports:
+    """
+    User exports running in this worker.
+
+    Each export writes its shards to its own directory under ``directory``,
+    where they stay after the job. Statuses are stored in MongoDB, so any
+    worker can report on them.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.running: dict[str, UserExportJob] = {}
+
+    async def start(self, partitions: int, output_format: ExportFormat, repository: UsersRepository,
+                    jobs: JobsRepository) -> ExportJobStatus:
+        job_id = uuid.uuid4().hex
+        now = datetime.now(timezone.utc)
+        status = ExportJobStatus(id=job_id, format=output_format, directory=os.path.join(self.directory, job_id),
+                                 worker=f"{socket.gethostname()}:{os.getpid()}", created_at=now, updated_at=now)
+        # Saved before the response, so the status can be polled from any worker at once
+        await jobs.save(status)
+        job = UserExportJob(status, partitions, jobs)
+        job.task = asyncio.create_task(job.run(repository))
+        self.running[job_id] = job
+        job.task.add_done_callback(lambda _: self.running.pop(job_id, None))
+        return status
+
+    def get(self, job_id: str) -> Optional[UserExportJob]:
+        """A job still running in this worker"""
+        return self.running.get(job_id)
+
+    async def close(self) -> None:
+        """Stop running exports; shards already written stay on disk"""
+        running = [job.task for job in self.running.values()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+def get_user_exports(request: Request) -> UserExports:
+    return request.app.state.user_exports
+
+
+UserExportsDep = Annotated[UserExports, Depends(get_user_exports)]
@@ -0,0 +1,251 @@
+import asyncio
+import csv
+import itertools
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from typing import IO, Annotated, Any, AsyncIterator, Iterator, Optional, Union
+from fastapi import Depends, Request
+from pydantic import ValidationError
+from cache.users import UserCache
+from repositories.jobs import ImportJobsRepository
+from repositories.users import UsersRepository
+from schema.bulk import describe_validation_error
+from schema.imports import ImportFormat, ImportJobStatus
+from schema.user import User
+
+logger = logging.getLogger(__name__)
+
+# Separates the roles in the roles column of a CSV import
+CSV_ROLE_SEPARATOR = ";"
+
+# (line number, parsed row or why it could not be parsed)
+ParsedRow = tuple[int, Union[dict[str, Any], str]]
+
+
+def parse_ndjson(source: IO[bytes]) -> Iterator[ParsedRow]:
+    """One JSON object per line; blank lines are skipped"""
+    for line_number, line in enumerate(source, start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as err:
+            yield line_number, f"Invalid JSON: {err}"
+            continue
+        if not isinstance(item, dict):
+            yield line_number, "Expected a JSON object"
+            continue
+        yield line_number, item
+
+
+def parse_csv(source: IO[str]) -> Iterator[ParsedRow]:
+    """
+    A header row naming User fields, then one user per row.
+
+    Empty cells fall back to the field default, and ``roles`` holds
+    semicolon-separated roles.
+    """
+    reader = csv.DictReader(source)
+    for row in reader:
+        # Cells past the header land under None and are ignored
+        item: dict[str, Any] = {key: value for key, value in row.items() if key is not None and value not in (None, "")}
+        if "roles" in item:
+            item["roles"] = [role.strip() for role in item["roles"].split(CSV_ROLE_SEPARATOR) if role.strip()]
+        yield reader.line_num, item
+
+
+class ImportChunk:
+    """Rows read in one go: the users to insert, their lines, and the rows rejected so far"""
+
+    def __init__(self):
+        self.rows = 0
+        self.users: list[User] = []
+        self.lines: list[int] = []
+        self.errors: list[tuple[int, str]] = []
+
+
+class UserImportJob:
+    """
+    Import users from a spooled CSV or NDJSON upload.
+
+    The file is read ``chunk_size`` rows at a time. Each chunk is validated
+    against User off the event loop and written with one unordered
+    insert_many, while the next chunk is being read. Rejected rows are
+    stored as ``{"line": ..., "error": ...}``, and the status is saved after
+    every chunk.
+    """
+
+    def __init__(self, status: ImportJobStatus, spool_path: str, chunk_size: int, jobs: ImportJobsRepository):
+        self.status = status
+        self.spool_path = spool_path
+        self.chunk_size = chunk_size
+        self.jobs = jobs
+        self.task: Optional[asyncio.Task] = None
+
+    def _open_rows(self) -> tuple[IO, Iterator[ParsedRow]]:
+        if self.status.format == "csv":
+            source = open(self.spool_path, newline="", encoding="utf-8-sig")
+            return source, parse_csv(source)
+        source = open(self.spool_path, "rb")
+        return source, parse_ndjson(source)
+
+    def _read_chunk(self, rows: Iterator[ParsedRow]) -> ImportChunk:
+        chunk = ImportChunk()
+        for line, item in itertools.islice(rows, self.chunk_size):
+            chunk.rows += 1
+            if isinstance(item, str):
+                chunk.errors.append((line, item))
+                continue
+            try:
+                chunk.users.append(User.model_validate(item))
+                chunk.lines.append(line)
+            except ValidationError as err:
+                chunk.errors.append((line, describe_validation_error(err)))
+        return chunk
+
+    async def _save(self) -> None:
+        self.status.updated_at = datetime.now(timezone.utc)
+        await self.jobs.save(self.status)
+
+    async def run(self, repository: UsersRepository, cache: UserCache) -> None:
+        self.status.state = "running"
+        try:
+            await self._save()
+            source, rows = await asyncio.to_thread(self._open_rows)
+            try:
+                await self._import(rows, repository, cache)
+            finally:
+                source.close()
+            self.status.state = "succeeded"
+        except asyncio.CancelledError:
+            self.status.state = "failed"
+            self.status.error = "Cancelled"
+            raise
+        except Exception as err:
+            logger.exception("User import %s failed", self.status.id)
+            self.status.state = "failed"
+            self.status.error = str(err)
+        finally:
+            self.status.finished_at = datetime.now(timezone.utc)
+            # The upload is no longer needed; the rejected rows stay in MongoDB
+            os.unlink(self.spool_path)
+            try:
+                await self._save()
+            except Exception:
+                logger.exception("Could not save the final status of user import %s", self.status.id)
+
+    async def _import(self, rows: Iterator[ParsedRow], repository: UsersRepository, cache: UserCache) -> None:
+        reading = asyncio.ensure_future(asyncio.to_thread(self._read_chunk, rows))
+        try:
+            while True:
+                chunk = await reading
+                if chunk.rows == 0:
+                    return
+                # Parse and validate the next chunk while this one is written
+                reading = asyncio.ensure_future(asyncio.to_thread(self._read_chunk, rows))
+
+                errors = chunk.errors
+                if chunk.users:
+                    inserted = await repository.insert_many(chunk.users, len(chunk.users))
+                    errors += [(line, error) for line, (_, error) in zip(chunk.lines, inserted) if error is not None]
+                    await cache.invalidate_users((user.email, user.username) for user in chunk.users)
+                    self.status.inserted += sum(1 for inserted_id, _ in inserted if inserted_id is not None)
+
+                await self.jobs.add_errors(self.status.id, sorted(errors))
+                self.status.rows += chunk.rows
+                self.status.failed += len(errors)
+                await self._save()
+        finally:
+            if not reading.done():
+                # Let the reader thread finish with the file before it is closed
+                await asyncio.gather(reading, return_exceptions=True)
+
+
+class UserImports:
+    """
+    User imports running in this worker.
+
+    Uploads are spooled to a private temporary directory and imported by the
+    worker that received them. Their status and rejected rows are stored in
+    MongoDB, so any worker can report on them.
+    """
+    SPOOL_CHUNK_BYTES = 1024 * 1024
+
+    def __init__(self, directory: Optional[str] = None):
+        self.parent_directory = directory
+        self.directory: Optional[str] = None
+        self.running: dict[str, UserImportJob] = {}
+
+    def _path(self, name: str) -> str:
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="user-imports-", dir=self.parent_directory)
+        return os.path.join(self.directory, name)
+
+    async def spool(self, job_id: str, stream: AsyncIterator[bytes]) -> tuple[str, int]:
+        """Write the upload to disk as it arrives; returns its path and size"""
+        path = self._path(f"{job_id}.upload")
+        size = 0
+        spool = await asyncio.to_thread(open, path, "wb")
+        try:
+            buffer = bytearray()
+            async for part in stream:
+                buffer += part
+                if len(buffer) >= self.SPOOL_CHUNK_BYTES:
+                    await asyncio.to_thread(spool.write, buffer)
+                    size += len(buffer)
+                    buffer = bytearray()
+            await asyncio.to_thread(spool.write, buffer)
+            size += len(buffer)
+        except BaseException:
+            spool.close()
+            os.unlink(path)
+            raise
+        spool.close()
+        return path, size
+
+    async def start(self, stream: AsyncIterator[bytes], source_format: ImportFormat, chunk_size: int,
+                    repository: UsersRepository, cache: UserCache, jobs: ImportJobsRepository) -> ImportJobStatus:
+        """Spool the upload, then import it in the background"""
+        job_id = uuid.uuid4().hex
+        spool_path, size = await self.spool(job_id, stream)
+        now = datetime.now(timezone.utc)
+        status = ImportJobStatus(id=job_id, format=source_format, size_bytes=size,
+                                 worker=f"{socket.gethostname()}:{os.getpid()}", created_at=now, updated_at=now)
+        try:
+            # Saved before the response, so the status can be polled from any worker at once
+            await jobs.save(status)
+        except BaseException:
+            os.unlink(spool_path)
+            raise
+        job = UserImportJob(status, spool_path, chunk_size, jobs)
+        job.task = asyncio.create_task(job.run(repository, cache))
+        self.running[job_id] = job
+        job.task.add_done_callback(lambda _: self.running.pop(job_id, None))
+        return status
+
+    def get(self, job_id: str) -> Optional[UserImportJob]:
+        """A job still running in this worker"""
+        return self.running.get(job_id)
+
+    async def close(self) -> None:
+        """Stop running imports and remove their uploads"""
+        running = [job.task for job in self.running.values()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+
+def get_user_imports(request: Request) -> UserImports:
+    return request.app.state.user_imports
+
+
+UserImportsDep = Annotated[UserImports, Depends(get_user_imports)]
@@ -0,0 +1,10 @@
+from typing import ClassVar
+from pydantic import Field
+from database.settings import EnvSettings
+
+
+class ExportSettings(EnvSettings):
+    """User export settings, read from ``USER_EXPORT_*`` environment variables"""
+    ENV_PREFIX: ClassVar[str] = "USER_EXPORT_"
+
+    directory: str = Field(default="exports", description="Directory each export writes its shards under")
@@ -0,0 +1,62 @@
+from typing import Annotated, Any, AsyncIterator, Optional
+from fastapi import Depends, Request
+from pydantic import BaseModel
+from pymongo import ASCENDING, IndexModel
+
+
+class JobsRepository:
+    """
+    Status of background jobs, one document per job.
+
+    Jobs run in the worker that started them, but their status is kept in
+    MongoDB so any worker can report on them.
+    """
+    IMPORTS_COLLECTION = "import_jobs"
+    EXPORTS_COLLECTION = "export_jobs"
+
+    def __init__(self, collection: Any):
+        self.collection = collection
+
+    async def save(self, status: BaseModel) -> None:
+        await self.collection.replace_one({"_id": status.id}, status.model_dump(), upsert=True)
+
+    async def get(self, job_id: str) -> Optional[dict[str, Any]]:
+        return await self.collection.find_one({"_id": job_id}, {"_id": 0})
+
+
+class ImportJobsRepository(JobsRepository):
+    """Import statuses, plus the rows each import rejected, one document per row"""
+    ERRORS_COLLECTION = "import_errors"
+    ERRORS_INDEXES = [
+        IndexModel([("job_id", ASCENDING), ("line", ASCENDING)], name="job_line"),
+    ]
+
+    def __init__(self, collection: Any, errors_collection: Any):
+        super().__init__(collection)
+        self.errors_collection = errors_collection
+
+    async def add_errors(self, job_id: str, errors: list[tuple[int, str]]) -> None:
+        if errors:
+            await self.errors_collection.insert_many(
+                [{"job_id": job_id, "line": line, "error": error} for line, error in errors], ordered=False
+            )
+
+    async def iterate_errors(self, job_id: str) -> AsyncIterator[dict[str, Any]]:
+        """Yield ``{"line": ..., "error": ...}`` for every rejected row, in line order"""
+        cursor = self.errors_collection.find({"job_id": job_id}, {"_id": 0, "line": 1, "error": 1}).sort("line", 1)
+        async for error in cursor:
+            yield error
+
+
+def get_import_jobs_repository(request: Request) -> ImportJobsRepository:
+    return request.app.state.import_jobs
+
+
+ImportJobsRepositoryDep = Annotated[ImportJobsRepository, Depends(get_import_jobs_repository)]
+
+
+def get_export_jobs_repository(request: Request) -> JobsRepository:
+    return request.app.state.export_jobs
+
+
+ExportJobsRepositoryDep = Annotated[JobsRepository, Depends(get_export_jobs_repository)]
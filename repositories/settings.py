@@ -0,0 +1,12 @@
+from typing import ClassVar
+from pydantic import Field
+from database.settings import EnvSettings
+
+
+class WriteBehindSettings(EnvSettings):
+    """Batched user inserts, read from ``USER_WRITE_*`` environment variables"""
+    ENV_PREFIX: ClassVar[str] = "USER_WRITE_"
+
+    batch: bool = Field(default=False, description="Queue POST /users/ inserts and write them with insert_many")
+    batch_interval_ms: float = Field(default=5.0, gt=0, description="Longest a queued user waits for its batch")
+    batch_max_docs: int = Field(default=500, ge=1, le=100000, description="Queued users that flush a batch at once")
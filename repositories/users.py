@@ -0,0 +1,229 @@
+from typing import Annotated, Any, AsyncIterator, Optional, Sequence, Union
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from fastapi import Depends, Request
+from pymongo import ASCENDING, DeleteOne, IndexModel, ReadPreference, ReturnDocument, UpdateOne
+from pymongo.read_concern import ReadConcern
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+from pymongo.results import UpdateResult
+from pymongo.write_concern import WriteConcern
+from schema.bulk import BulkUserOperation, BulkWriteChunkResult
+from schema.user import User, UserResponse
+
+UserDocument = dict[str, Any]
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class UsersRepository:
+    """Typed access to the ``users`` collection"""
+    COLLECTION = "users"
+    CODEC_OPTIONS = CodecOptions(tz_aware=True)
+    READ_CONCERN = ReadConcern("local")
+    READ_PREFERENCE = ReadPreference.PRIMARY
+    WRITE_CONCERN = WriteConcern(w="majority")
+    # Documents per getMore when streaming the whole collection
+    STREAM_BATCH_SIZE = 1000
+    # Only the fields exposed through UserResponse
+    PUBLIC_PROJECTION = {"_id": 0, **{field: 1 for field in UserResponse.model_fields}}
+    INDEXES = [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ]
+
+    def __init__(self, collection: Any):
+        # The handle is configured once and reused by every request
+        self.collection = collection.with_options(
+            codec_options=self.CODEC_OPTIONS,
+            read_concern=self.READ_CONCERN,
+            read_preference=self.READ_PREFERENCE,
+            write_concern=self.WRITE_CONCERN,
+        )
+
+    @classmethod
+    def projection(cls, fields: Optional[Sequence[str]] = None, include_id: bool = False) -> dict[str, int]:
+        """The public projection, narrowed to ``fields`` if given"""
+        if fields is None:
+            projection = dict(cls.PUBLIC_PROJECTION)
+        else:
+            unknown = set(fields) - set(UserResponse.model_fields)
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+            projection = {"_id": 0, **{field: 1 for field in fields}}
+        if include_id:
+            # Paging and cache tags need the _id even if it is not returned
+            projection["_id"] = 1
+        return projection
+
+    async def get_by_id(self, user_id: ObjectId) -> Optional[UserDocument]:
+        return await self.collection.find_one({"_id": user_id})
+
+    async def get_by_email(self, email: str) -> Optional[UserDocument]:
+        return await self.collection.find_one({"email": email}, self.PUBLIC_PROJECTION)
+
+    async def get_by_username(self, username: str) -> Optional[UserDocument]:
+        return await self.collection.find_one({"username": username}, self.PUBLIC_PROJECTION)
+
+    async def search(self, search: str, fields: Optional[Sequence[str]] = None,
+                     include_id: bool = False) -> list[UserDocument]:
+        """Users whose email or username equals ``search``"""
+        cursor = self.collection.find({"$or": [{"email": search}, {"username": search}]},
+                                      self.projection(fields, include_id))
+        return [user async for user in cursor]
+
+    async def search_many(self, searches: Sequence[str]) -> dict[str, list[UserDocument]]:
+        """
+        Users matching each of ``searches`` by email or username, read with
+        one query. They keep their ``_id``, which cached lookups are tagged with.
+        """
+        cursor = self.collection.find({"$or": [{"email": {"$in": list(searches)}},
+                                               {"username": {"$in": list(searches)}}]},
+                                      self.projection(include_id=True))
+        found: dict[str, list[UserDocument]] = {search: [] for search in searches}
+        async for user in cursor:
+            # A user can answer two searches: one for its email, one for its username
+            for key in {user.get("email"), user.get("username")}:
+                if key in found:
+                    found[key].append(user)
+        return found
+
+    async def list_page(self, after: Optional[ObjectId] = None, limit: int = 0,
+                        fields: Optional[Sequence[str]] = None) -> list[UserDocument]:
+        """Users in ``_id`` order, starting after ``after``; a ``limit`` of 0 means no limit"""
+        query = {} if after is None else {"_id": {"$gt": after}}
+        cursor = self.collection.find(query, self.projection(fields, include_id=True)).sort("_id", 1).limit(limit)
+        return [user async for user in cursor]
+
+    async def iterate(self, after: Optional[ObjectId] = None, fields: Optional[Sequence[str]] = None,
+                      batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[UserDocument]:
+        """Yield every user in ``_id`` order as the cursor's batches arrive"""
+        query = {} if after is None else {"_id": {"$gt": after}}
+        cursor = self.collection.find(query, self.projection(fields)).sort("_id", 1).batch_size(batch_size)
+        async for user in cursor:
+            yield user
+
+    async def iterate_range(self, lower: Optional[ObjectId] = None, upper: Optional[ObjectId] = None,
+                            batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[UserDocument]:
+        """Yield the users whose ``_id`` is in ``[lower, upper)``; either bound may be open"""
+        bounds = {}
+        if lower is not None:
+            bounds["$gte"] = lower
+        if upper is not None:
+            bounds["$lt"] = upper
+        query = {"_id": bounds} if bounds else {}
+        cursor = self.collection.find(query, self.PUBLIC_PROJECTION).batch_size(batch_size)
+        async for user in cursor:
+            yield user
+
+    async def sample_ids(self, size: int) -> list[ObjectId]:
+        """``_id`` values of up to ``size`` random users, used to split the collection into ranges"""
+        cursor = await self.collection.aggregate([{"$sample": {"size": size}}, {"$project": {"_id": 1}}])
+        return [document["_id"] async for document in cursor]
+
+    async def insert(self, user: User) -> UserDocument:
+        """Insert ``user`` and return the stored document, including its generated ``_id``"""
+        document = user.model_dump(by_alias=True)
+        result = await self.collection.insert_one(document)
+        document["_id"] = result.inserted_id
+        return document
+
+    async def insert_batch(self, users: Sequence[User]) -> list[Union[UserDocument, WriteError]]:
+        """
+        Insert ``users`` with one unordered insert_many call.
+
+        Returns, per user in input order, the stored document with its ``_id``
+        or the error that rejected it (a ``DuplicateKeyError`` for duplicates).
+        """
+        # Ids are assigned here so each item's id is known even if others fail
+        outcomes: list[Union[UserDocument, WriteError]] = [
+            {"_id": ObjectId(), **user.model_dump(by_alias=True)} for user in users
+        ]
+        try:
+            await self.collection.insert_many(outcomes, ordered=False)
+        except BulkWriteError as err:
+            for write_error in err.details["writeErrors"]:
+                code = write_error.get("code")
+                error_class = DuplicateKeyError if code == DUPLICATE_KEY_ERROR else WriteError
+                outcomes[write_error["index"]] = error_class(write_error.get("errmsg", ""), code, write_error)
+        return outcomes
+
+    async def insert_many(self, users: Sequence[User], chunk_size: int) -> list[tuple[Optional[ObjectId], Optional[str]]]:
+        """
+        Insert ``users`` with unordered insert_many calls of ``chunk_size`` documents.
+
+        Returns one ``(inserted_id, error)`` pair per user, in input order.
+        """
+        results: list[tuple[Optional[ObjectId], Optional[str]]] = []
+        for start in range(0, len(users), chunk_size):
+            results.extend(
+                (None, self.describe_write_error(outcome.details)) if isinstance(outcome, WriteError)
+                else (outcome["_id"], None)
+                for outcome in await self.insert_batch(users[start:start + chunk_size])
+            )
+        return results
+
+    async def bulk_write(self, operations: Sequence[BulkUserOperation],
+                         chunk_size: int) -> tuple[list[BulkWriteChunkResult], dict[int, str]]:
+        """
+        Apply update and delete operations keyed by email with unordered
+        bulk_write calls of ``chunk_size`` operations.
+
+        Returns the counts of each chunk and the errors keyed by operation index.
+        """
+        chunks: list[BulkWriteChunkResult] = []
+        errors: dict[int, str] = {}
+        for start in range(0, len(operations), chunk_size):
+            requests = [
+                UpdateOne({"email": operation.email}, {"$set": operation.changes.model_dump(exclude_none=True)})
+                if operation.op == "update" else DeleteOne({"email": operation.email})
+                for operation in operations[start:start + chunk_size]
+            ]
+            try:
+                result = (await self.collection.bulk_write(requests, ordered=False)).bulk_api_result
+            except BulkWriteError as err:
+                result = err.details
+                for write_error in result["writeErrors"]:
+                    errors[start + write_error["index"]] = self.describe_write_error(write_error)
+            chunks.append(BulkWriteChunkResult(
+                first=start,
+                last=start + len(requests) - 1,
+                matched=result["nMatched"],
+                modified=result["nModified"],
+                deleted=result["nRemoved"],
+            ))
+        return chunks, errors
+
+    @staticmethod
+    def describe_write_error(write_error: dict[str, Any]) -> str:
+        if write_error.get("code") == DUPLICATE_KEY_ERROR:
+            return "A user with this email or username already exists"
+        return write_error["errmsg"]
+
+    async def update(self, email: str, user: User) -> UpdateResult:
+        return await self.collection.update_one(
+            {"email": email},
+            {"$set": user.model_dump(by_alias=True)}
+        )
+
+    async def update_and_return(self, email: str, user: User) -> Optional[UserDocument]:
+        """Update the user with ``email`` and return its public fields after the update"""
+        return await self.collection.find_one_and_update(
+            {"email": email},
+            {"$set": user.model_dump(by_alias=True)},
+            projection=self.PUBLIC_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def delete(self, email: str) -> Optional[UserDocument]:
+        """Delete the user with ``email`` and return its public fields, or None if there was none"""
+        return await self.collection.find_one_and_delete(
+            {"email": email},
+            projection=self.PUBLIC_PROJECTION
+        )
+
+
+def get_users_repository(request: Request) -> UsersRepository:
+    return request.app.state.users
+
+
+UsersRepositoryDep = Annotated[UsersRepository, Depends(get_users_repository)]
@@ -0,0 +1,105 @@
+import asyncio
+import time
+from typing import Annotated, Any, Optional
+from fastapi import Depends, Request
+from pymongo.errors import WriteError
+from repositories.users import UserDocument, UsersRepository
+from schema.user import User
+
+
+class UserInsertBatcher:
+    """
+    Queue single user inserts and write them together.
+
+    Queued users are flushed with one unordered insert_many every
+    ``interval_seconds``, or as soon as ``max_docs`` are waiting. Each caller
+    waits for its own batch to commit and gets back its stored document, or
+    the error that rejected it.
+    """
+
+    def __init__(self, repository: UsersRepository, interval_seconds: float, max_docs: int):
+        self.repository = repository
+        self.interval_seconds = interval_seconds
+        self.max_docs = max_docs
+        self._queue: list[tuple[User, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: set[asyncio.Task] = set()
+        self.flushes = 0
+        self.full_flushes = 0
+        self.documents = 0
+        self.largest_batch = 0
+        self.flush_time_total_ms = 0.0
+        self.flush_time_max_ms = 0.0
+
+    async def insert(self, user: User) -> UserDocument:
+        future = asyncio.get_running_loop().create_future()
+        # Mark a failure as retrieved even if the caller went away
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._queue.append((user, future))
+        if len(self._queue) >= self.max_docs:
+            self.full_flushes += 1
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval_seconds, self.flush)
+        # A caller that goes away does not take its user out of the batch
+        return await asyncio.shield(future)
+
+    def flush(self) -> None:
+        """Write every queued user now"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._queue = self._queue, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._commit(batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _commit(self, batch: list[tuple[User, asyncio.Future]]) -> None:
+        started = time.perf_counter()
+        try:
+            outcomes = await self.repository.insert_batch([user for user, _ in batch])
+        except Exception as err:
+            for _, future in batch:
+                future.set_exception(err)
+            return
+        finally:
+            self._record(len(batch), (time.perf_counter() - started) * 1000)
+        for (_, future), outcome in zip(batch, outcomes):
+            if isinstance(outcome, WriteError):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    def _record(self, size: int, elapsed_ms: float) -> None:
+        self.flushes += 1
+        self.documents += size
+        self.largest_batch = max(self.largest_batch, size)
+        self.flush_time_total_ms += elapsed_ms
+        self.flush_time_max_ms = max(self.flush_time_max_ms, elapsed_ms)
+
+    async def close(self) -> None:
+        """Flush the queue and wait for every batch being written"""
+        self.flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "queued": len(self._queue),
+            "flushes": self.flushes,
+            "full_flushes": self.full_flushes,
+            "documents": self.documents,
+            "largest_batch": self.largest_batch,
+            "average_batch": self.documents / self.flushes if self.flushes else 0.0,
+            "flush_time_avg_ms": self.flush_time_total_ms / self.flushes if self.flushes else 0.0,
+            "flush_time_max_ms": self.flush_time_max_ms,
+        }
+
+
+def get_user_writer(request: Request) -> Optional[UserInsertBatcher]:
+    return request.app.state.user_writer
+
+
+UserWriterDep = Annotated[Optional[UserInsertBatcher], Depends(get_user_writer)]
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from jobs.exports import UserExportsDep
+from repositories.jobs import ExportJobsRepositoryDep
+from repositories.users import UsersRepositoryDep
+from schema.exports import ExportFormat, ExportJobStatus, ExportLimits
+
+router = APIRouter()
+
+
+@router.post("", response_model=ExportJobStatus, status_code=status.HTTP_202_ACCEPTED)
+async def start_user_export(
+        request: Request,
+        response: Response,
+        repository: UsersRepositoryDep,
+        exports: UserExportsDep,
+        jobs: ExportJobsRepositoryDep,
+        partitions: int = Query(ExportLimits.DEFAULT_PARTITIONS, ge=1, le=ExportLimits.MAX_PARTITIONS),
+        output_format: ExportFormat = Query("ndjson", alias="format")):
+    job = await exports.start(partitions, output_format, repository, jobs)
+    response.headers["Location"] = str(request.url_for("get_user_export", job_id=job.id))
+    return job
+
+
+@router.get("/{job_id}", response_model=ExportJobStatus)
+async def get_user_export(job_id: str, jobs: ExportJobsRepositoryDep):
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="No export found")
+    return job
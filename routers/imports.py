@@ -0,0 +1,66 @@
+from typing import AsyncIterator, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from cache.users import UserCacheDep
+from jobs.imports import UserImportsDep
+from repositories.jobs import ImportJobsRepository, ImportJobsRepositoryDep
+from repositories.users import UsersRepositoryDep
+from schema.bulk import BulkLimits
+from schema.imports import ImportFormat, ImportJobStatus
+from schema.responses import dumps
+
+router = APIRouter()
+
+# Content types understood when no format is given
+CONTENT_TYPE_FORMATS: dict[str, ImportFormat] = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+@router.post("", response_model=ImportJobStatus, status_code=status.HTTP_202_ACCEPTED)
+async def start_user_import(
+        request: Request,
+        response: Response,
+        repository: UsersRepositoryDep,
+        cache: UserCacheDep,
+        imports: UserImportsDep,
+        jobs: ImportJobsRepositoryDep,
+        source_format: Optional[ImportFormat] = Query(None, alias="format"),
+        chunk_size: int = Query(BulkLimits.DEFAULT_CHUNK_SIZE, ge=1, le=BulkLimits.MAX_CHUNK_SIZE)):
+    if source_format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        source_format = CONTENT_TYPE_FORMATS.get(content_type)
+    if source_format is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="Send text/csv or application/x-ndjson, or pass format=csv|ndjson")
+
+    job = await imports.start(request.stream(), source_format, chunk_size, repository, cache, jobs)
+    response.headers["Location"] = str(request.url_for("get_user_import", job_id=job.id))
+    return job
+
+
+@router.get("/{job_id}", response_model=ImportJobStatus)
+async def get_user_import(job_id: str, jobs: ImportJobsRepositoryDep):
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="No import found")
+    return job
+
+
+async def stream_import_errors(jobs: ImportJobsRepository, job_id: str) -> AsyncIterator[bytes]:
+    async for error in jobs.iterate_errors(job_id):
+        yield dumps(error) + b"\n"
+
+
+@router.get("/{job_id}/errors")
+async def get_user_import_errors(job_id: str, jobs: ImportJobsRepositoryDep):
+    if await jobs.get(job_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="No import found")
+    # Rejected rows so far; the report is complete once the job has finished
+    filename = f"user-import-{job_id}-errors.ndjson"
+    return StreamingResponse(stream_import_errors(jobs, job_id), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
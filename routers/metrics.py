@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Request
+
+router = APIRouter()
+
+
+@router.get("/db-executor")
+async def get_db_executor_metrics(request: Request) -> dict:
+    executor = request.app.state.mongo.executor
+    if executor is None:
+        return {"enabled": False}
+    return {"enabled": True, **executor.metrics()}
+
+
+@router.get("/indexes")
+async def get_index_drift(request: Request) -> dict:
+    return await request.app.state.user_indexes.drift()
+
+
+@router.get("/user-cache")
+async def get_user_cache_metrics(request: Request) -> dict:
+    metrics = request.app.state.user_cache.metrics()
+    change_stream = request.app.state.user_change_stream
+    if change_stream is not None:
+        metrics["change_stream"] = change_stream.metrics()
+    return metrics
+
+
+@router.get("/user-lookups")
+async def get_user_lookup_metrics(request: Request) -> dict:
+    metrics = request.app.state.user_lookups.metrics()
+    loader = request.app.state.user_loader
+    metrics["batching"] = {"enabled": False} if loader is None else {"enabled": True, **loader.metrics()}
+    return metrics
+
+
+@router.get("/user-writes")
+async def get_user_write_metrics(request: Request) -> dict:
+    writer = request.app.state.user_writer
+    if writer is None:
+        return {"enabled": False}
+    return {"enabled": True, **writer.metrics()}
@@ -0,0 +1,60 @@
+from typing import Literal, Optional
+from pydantic import BaseModel, EmailStr, Field, ValidationError, model_validator
+from schema.user import UserChanges
+
+
+class BulkLimits:
+    """Size limits of the bulk endpoints"""
+    DEFAULT_CHUNK_SIZE = 1000
+    MAX_CHUNK_SIZE = 10000
+    MAX_ITEMS = 100000
+
+
+class BulkItemResult(BaseModel):
+    index: int = Field(..., description="Position of the item in the request")
+    id: Optional[str] = Field(None, description="Id of the created user")
+    error: Optional[str] = Field(None, description="Why the item was rejected")
+
+
+class BulkCreateResponse(BaseModel):
+    created: int
+    failed: int
+    results: list[BulkItemResult]
+
+
+class BulkUserOperation(BaseModel):
+    op: Literal["update", "delete"]
+    email: EmailStr = Field(..., description="Email of the user to change")
+    changes: Optional[UserChanges] = Field(None, description="Fields to set, for update operations")
+
+    @model_validator(mode='after')
+    def validate_changes(self) -> 'BulkUserOperation':
+        if self.op == "update" and not (self.changes and self.changes.model_dump(exclude_none=True)):
+            raise ValueError("update operations need at least one field in changes")
+        if self.op == "delete" and self.changes is not None:
+            raise ValueError("delete operations take no changes")
+        return self
+
+
+class BulkWriteChunkResult(BaseModel):
+    first: int = Field(..., description="Index of the first operation in the chunk")
+    last: int = Field(..., description="Index of the last operation in the chunk")
+    matched: int
+    modified: int
+    deleted: int
+
+
+class BulkWriteResponse(BaseModel):
+    matched: int
+    modified: int
+    deleted: int
+    chunks: list[BulkWriteChunkResult]
+    errors: list[BulkItemResult]
+
+
+def describe_validation_error(err: ValidationError) -> str:
+    """One line naming each invalid field of an item and what is wrong with it"""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc']) or 'body'}: {error['msg']}"
+        for error in err.errors()
+    )
@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import Literal, Optional
+from pydantic import BaseModel, Field
+
+ExportFormat = Literal["ndjson", "parquet"]
+
+
+class ExportLimits:
+    """Bounds of the export endpoint"""
+    DEFAULT_PARTITIONS = 4
+    MAX_PARTITIONS = 64
+    # Random _ids sampled per partition to place the range boundaries
+    SAMPLES_PER_PARTITION = 100
+    # Users written to a shard at a time
+    WRITE_BATCH_SIZE = 1000
+
+
+class ExportPartitionStatus(BaseModel):
+    file: str = Field(..., description="Shard written for this partition")
+    lower: Optional[str] = Field(None, description="First _id of the range, open if unset")
+    upper: Optional[str] = Field(None, description="_id the range stops before, open if unset")
+    documents: int = 0
+    done: bool = False
+
+
+class ExportJobStatus(BaseModel):
+    """Progress of a users export running in the background"""
+    id: str
+    format: ExportFormat
+    state: Literal["queued", "running", "succeeded", "failed"] = "queued"
+    directory: str = Field(..., description="Directory the shards are written to")
+    documents: int = Field(0, description="Users written so far, over every partition")
+    partitions: list[ExportPartitionStatus] = Field(default_factory=list)
+    worker: str = Field(..., description="Host and process id of the worker writing the shards")
+    created_at: datetime
+    updated_at: datetime = Field(..., description="Last time the status was saved; it stops moving if the worker dies")
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = Field(None, description="Why the export stopped, if it failed")
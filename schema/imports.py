@@ -0,0 +1,21 @@
+from datetime import datetime
+from typing import Literal, Optional
+from pydantic import BaseModel, Field
+
+ImportFormat = Literal["csv", "ndjson"]
+
+
+class ImportJobStatus(BaseModel):
+    """Progress of a user import running in the background"""
+    id: str
+    format: ImportFormat
+    state: Literal["queued", "running", "succeeded", "failed"] = "queued"
+    size_bytes: int = Field(0, description="Size of the uploaded file")
+    rows: int = Field(0, description="Rows read so far")
+    inserted: int = Field(0, description="Users created so far")
+    failed: int = Field(0, description="Rows rejected so far; see the error report")
+    worker: str = Field(..., description="Host and process id of the worker running the import")
+    created_at: datetime
+    updated_at: datetime = Field(..., description="Last time the status was saved; it stops moving if the worker dies")
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = Field(None, description="Why the import stopped, if it failed")
@@ -0,0 +1,27 @@
+import base64
+import binascii
+from bson import ObjectId
+from bson.errors import InvalidId
+
+
+class PaginationLimits:
+    """Page sizes accepted by the listing endpoints"""
+    DEFAULT_PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+    NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageCursor:
+    """Opaque next-page token wrapping the ``_id`` of the last document of a page"""
+
+    @staticmethod
+    def encode(last_id: ObjectId) -> str:
+        return base64.urlsafe_b64encode(last_id.binary).decode().rstrip("=")
+
+    @staticmethod
+    def decode(token: str) -> ObjectId:
+        try:
+            padded = token + "=" * (-len(token) % 4)
+            return ObjectId(base64.urlsafe_b64decode(padded))
+        except (binascii.Error, InvalidId, TypeError, ValueError):
+            raise ValueError(f"Invalid page cursor: {token}")
@@ -0,0 +1,37 @@
+import json
+from datetime import datetime
+from typing import Any
+
+from bson import Decimal128, ObjectId
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_bson(value: Any) -> Any:
+    """Fallback encoder for values JSON has no type for"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        # orjson encodes datetimes natively and only calls encode_bson for the rest
+        return orjson.dumps(content, default=encode_bson, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=encode_bson, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, which also encodes ObjectId and datetime values"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -4,10 +4,12 @@ from pydantic import (
     BaseModel,
     Field,
     EmailStr,
+    TypeAdapter,
     field_validator,
     model_validator,
     ConfigDict
 )
+from typing_extensions import TypedDict
 import re
 
 
@@ -105,3 +107,45 @@ class UserResponse(BaseModel):
     email: EmailStr
     full_name: str
     roles: List[str]
+
+
+class UserRecord(TypedDict):
+    """
+    A UserResponse as read from the users collection.
+
+    Stored users were validated as User when they were written, so reads
+    only check the shape and do not parse the email address again.
+    """
+    username: str
+    email: str
+    full_name: str
+    roles: List[str]
+
+
+# Validate and serialize stored users, one at a time or a whole list in one pass
+UserRecordAdapter = TypeAdapter(UserRecord)
+UserRecords = TypeAdapter(List[UserRecord])
+
+
+class UserChanges(BaseModel):
+    """Partial update of a user; only the fields that are set are written"""
+    model_config = ConfigDict(validate_assignment=True, str_strip_whitespace=True, extra="forbid")
+
+    username: Optional[str] = Field(
+        None,
+        min_length=UserValidation.USERNAME_MIN_LENGTH,
+        max_length=UserValidation.USERNAME_MAX_LENGTH
+    )
+    full_name: Optional[str] = Field(None, max_length=UserValidation.FULLNAME_MAX_LENGTH)
+    is_active: Optional[bool] = None
+    roles: Optional[List[str]] = None
+
+    @field_validator('username')
+    @classmethod
+    def validate_username(cls, v: Optional[str]) -> Optional[str]:
+        return UserValidation.validate_username_format(v) if v is not None else v
+
+    @field_validator('roles')
+    @classmethod
+    def validate_user_roles(cls, v: Optional[List[str]]) -> Optional[List[str]]:
+        return UserValidation.validate_roles(v) if v is not None else v
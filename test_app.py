@@ -1,51 +1,121 @@
-from app import app
+from app import app, mongo
+from contextlib import contextmanager
 from fastapi import HTTPException, status
 from fastapi.testclient import TestClient
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from bson import ObjectId
+from cache.settings import CacheSettings
+from cache.shared import SharedCache
+from cache.users import UserCache, get_user_cache
+from repositories.jobs import (ImportJobsRepository, JobsRepository, get_export_jobs_repository,
+                               get_import_jobs_repository)
+from repositories.users import UsersRepository, get_users_repository
+from schema.pagination import PaginationLimits
+from schema.responses import FastJSONResponse
 from schema.user import User
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+from datetime import datetime
+import asyncio
+import httpx
+import json
 import pytest
 
 client = TestClient(app)
 
+
+@pytest.fixture(scope="module")
+def live_client():
+    """
+    A client that runs the app's lifespan, so requests reach the MongoDB at
+    MONGODB_URL; tests using it are skipped when no server answers.
+    """
+    with TestClient(app) as live_client:
+        try:
+            live_client.portal.call(mongo.db.command, "ping")
+        except Exception as err:
+            pytest.skip(f"MongoDB is not reachable: {type(err).__name__}")
+        yield live_client
+
+
+class AsyncCursorMock:
+    """Minimal stand-in for an AsyncCursor that yields the given documents"""
+
+    def __init__(self, documents):
+        self.documents = list(documents)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+
+@contextmanager
+def mock_users_collection(cache=None):
+    """Serve the /users endpoints from a UsersRepository over a mocked collection"""
+    collection = MagicMock()
+    collection.with_options.return_value = collection
+    # find() returns a cursor whose sort() and limit() chain back to it
+    collection.find.return_value.sort.return_value.limit.return_value = AsyncCursorMock([])
+    cache = cache or UserCache(CacheSettings(enabled=False))
+    app.dependency_overrides[get_users_repository] = lambda: UsersRepository(collection)
+    app.dependency_overrides[get_user_cache] = lambda: cache
+    try:
+        yield collection
+    finally:
+        app.dependency_overrides.pop(get_users_repository, None)
+        app.dependency_overrides.pop(get_user_cache, None)
+
+
+@contextmanager
+def mock_import_jobs(status, errors=()):
+    """Serve import statuses from an ImportJobsRepository over mocked collections"""
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value=status)
+    errors_collection = MagicMock()
+    errors_collection.find.return_value.sort.return_value = AsyncCursorMock(errors)
+    app.dependency_overrides[get_import_jobs_repository] = lambda: ImportJobsRepository(collection, errors_collection)
+    try:
+        yield collection, errors_collection
+    finally:
+        app.dependency_overrides.pop(get_import_jobs_repository, None)
+
+
 class TestApp:
 
     def test_create_user_1(self):
         """
-        Test case for creating a user when the created_user is None.
+        Test case for creating a user with confirm=true when the created_user is None.
         This test verifies that an HTTPException with status code 500 is raised
-        when the database operation fails to return a created user.
+        when the read-back fails to return the created user.
         """
         # Mock user data
         test_user = User(username="testuser", email="test@example.com", password="testpass")
 
         # Mock the database operations
-        def mock_insert_one(user_dict):
-            class MockResult:
-                inserted_id = "mock_id"
-            return MockResult()
-
-        def mock_find_one():
-            return None  # Simulate that no user was found after insertion
+        class MockResult:
+            inserted_id = "mock_id"
 
-        # Apply the mocks
-        app.db.get_collection("users").insert_one = mock_insert_one
-        app.db.get_collection("users").find_one = mock_find_one
+        with mock_users_collection() as collection:
+            collection.insert_one = AsyncMock(return_value=MockResult())
+            # Simulate that no user was found after insertion
+            collection.find_one = AsyncMock(return_value=None)
 
-        # Make the request and check the response
-        with pytest.raises(HTTPException) as exc_info:
-            response = client.post("/users/", json=test_user.model_dump())
+            response = client.post("/users/?confirm=true", json=test_user.model_dump(mode="json"))
 
-        assert exc_info.value.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
-        assert exc_info.value.detail == "Failed to create user"
+        assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+        assert response.json()["detail"] == "Failed to create user"
 
-    def test_create_user_2(self):
+    def test_create_user_2(self, live_client):
         """
         Test creating a user when the user is successfully inserted into the database.
         This test verifies that when a valid user is provided, the create_user function
         inserts the user into the database and returns the created user object.
         """
         test_user = User(username="testuser", email="test@example.com", password="testpassword")
-        response = client.post("/users/", json=test_user.model_dump())
+        response = live_client.post("/users/", json=test_user.model_dump())
 
         assert response.status_code == status.HTTP_201_CREATED
         created_user = response.json()
@@ -65,22 +135,152 @@ class TestApp:
         }
 
         # Mock the database insert operation to simulate a failure
-        def mock_insert_one(*args, **kwargs):
-            class MockResult:
-                @property
-                def inserted_id(self):
-                    return None
-            return MockResult()
+        class MockResult:
+            @property
+            def inserted_id(self):
+                return None
 
-        # Apply the mock
-        app.db.get_collection("users").insert_one = mock_insert_one
+        with mock_users_collection() as collection:
+            collection.insert_one = AsyncMock(return_value=MockResult())
+            collection.find_one = AsyncMock(return_value=None)
+
+            response = client.post("/users/", json=valid_user_data)
 
-        response = client.post("/users/", json=valid_user_data)
         assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
         assert response.json()["detail"] == "Failed to create user"
 
-        # Reset the mock to avoid affecting other tests
-        app.db.get_collection("users").insert_one = lambda x: x
+    def test_create_user_without_read_back(self):
+        """
+        Test that by default create_user answers from the validated payload and
+        the generated id, without reading the document back.
+        """
+        class MockResult:
+            inserted_id = "mock_id"
+
+        with mock_users_collection() as collection:
+            collection.insert_one = AsyncMock(return_value=MockResult())
+            collection.find_one = AsyncMock()
+
+            response = client.post("/users/", json={"username": "testuser", "email": "test@example.com"})
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json()["username"] == "testuser"
+        collection.find_one.assert_not_called()
+
+    def test_create_user_duplicate(self):
+        """
+        Test that create_user returns 409 Conflict when the unique index on
+        email or username rejects the insert.
+        """
+        with mock_users_collection() as collection:
+            collection.insert_one = AsyncMock(side_effect=DuplicateKeyError("E11000 duplicate key error"))
+
+            response = client.post("/users/", json={"username": "testuser", "email": "test@example.com"})
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.json()["detail"] == "A user with this email or username already exists"
+
+    def test_create_user_write_behind(self):
+        """
+        Test that with write-behind on, create_user answers from its batch's
+        outcome: the stored user, or 409 for a duplicate.
+        """
+        writer = MagicMock()
+        writer.insert = AsyncMock(side_effect=[
+            {"_id": ObjectId(), "username": "testuser", "email": "test@example.com"},
+            DuplicateKeyError("E11000 duplicate key error"),
+        ])
+        app.state.user_writer = writer
+        try:
+            with mock_users_collection() as collection:
+                collection.insert_one = AsyncMock()
+                payload = {"username": "testuser", "email": "test@example.com"}
+
+                created = client.post("/users/", json=payload)
+                duplicate = client.post("/users/", json=payload)
+        finally:
+            app.state.user_writer = None
+
+        assert created.status_code == status.HTTP_201_CREATED
+        assert created.json()["username"] == "testuser"
+        assert duplicate.status_code == status.HTTP_409_CONFLICT
+        collection.insert_one.assert_not_called()
+
+    def test_create_users_bulk_reports_each_item(self):
+        """
+        Test that the bulk endpoint inserts valid users in unordered chunks and
+        reports a created id, a validation error or a duplicate per item.
+        """
+        payload = [
+            {"username": "user0", "email": "user0@example.com"},
+            {"username": "user1", "email": "invalid_email"},
+            {"username": "user2", "email": "user2@example.com"},
+            {"username": "user3", "email": "user3@example.com"},
+        ]
+
+        async def insert_many(documents, ordered):
+            # The second chunk holds user3, which collides with an existing user
+            if documents[0]["username"] == "user3":
+                raise BulkWriteError({"writeErrors": [{"index": 0, "code": 11000, "errmsg": "E11000"}]})
+
+        with mock_users_collection() as collection:
+            collection.insert_many = AsyncMock(side_effect=insert_many)
+
+            response = client.post("/users/bulk?chunk_size=2", json=payload)
+
+        assert response.status_code == status.HTTP_200_OK
+        body = response.json()
+        assert body["created"] == 2
+        assert body["failed"] == 2
+        assert [result["id"] is not None for result in body["results"]] == [True, False, True, False]
+        assert "email" in body["results"][1]["error"]
+        assert body["results"][3]["error"] == "A user with this email or username already exists"
+        assert collection.insert_many.call_count == 2
+        assert all(call.kwargs["ordered"] is False for call in collection.insert_many.call_args_list)
+
+    def test_write_users_bulk_counts_per_chunk(self):
+        """
+        Test that bulk update and delete operations are sent as unordered
+        bulk_write calls per chunk and their counts are reported per chunk
+        and in total, together with per-operation errors.
+        """
+        operations = [
+            {"op": "update", "email": "user0@example.com", "changes": {"roles": ["admin"]}},
+            {"op": "delete", "email": "user1@example.com"},
+            {"op": "update", "email": "user2@example.com", "changes": {"username": "taken"}},
+        ]
+
+        async def bulk_write(requests, ordered):
+            if len(requests) == 2:
+                result = MagicMock()
+                result.bulk_api_result = {"nMatched": 1, "nModified": 1, "nRemoved": 1}
+                return result
+            raise BulkWriteError({"nMatched": 0, "nModified": 0, "nRemoved": 0,
+                                  "writeErrors": [{"index": 0, "code": 11000, "errmsg": "E11000"}]})
+
+        with mock_users_collection() as collection:
+            collection.bulk_write = AsyncMock(side_effect=bulk_write)
+
+            response = client.post("/users/bulk/write?chunk_size=2", json=operations)
+
+        assert response.status_code == status.HTTP_200_OK
+        body = response.json()
+        assert (body["matched"], body["modified"], body["deleted"]) == (1, 1, 1)
+        assert [(chunk["first"], chunk["last"]) for chunk in body["chunks"]] == [(0, 1), (2, 2)]
+        assert body["errors"] == [{"index": 2, "id": None,
+                                   "error": "A user with this email or username already exists"}]
+        first_requests = collection.bulk_write.call_args_list[0].args[0]
+        assert first_requests == [UpdateOne({"email": "user0@example.com"}, {"$set": {"roles": ["admin"]}}),
+                                  DeleteOne({"email": "user1@example.com"})]
+
+    def test_write_users_bulk_rejects_update_without_changes(self):
+        """
+        Test that an update operation without any field to set is rejected.
+        """
+        with mock_users_collection():
+            response = client.post("/users/bulk/write", json=[{"op": "update", "email": "user0@example.com"}])
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
 
     def test_create_user_validation_error(self):
         """
@@ -93,9 +293,11 @@ class TestApp:
             "full_name": "Test User"
         }
 
-        response = client.post("/users/", json=invalid_user_data)
+        with mock_users_collection():
+            response = client.post("/users/", json=invalid_user_data)
+
         assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
-        assert "value is not a valid email address" in response.json()["detail"]
+        assert any("value is not a valid email address" in error["msg"] for error in response.json()["detail"])
 
     def test_delete_user_1(self):
         """
@@ -106,41 +308,39 @@ class TestApp:
         message is returned.
         """
         test_email = "test@example.com"
-        mock_user = {"email": test_email}
-
-        with patch("app.db.get_collection") as mock_get_collection:
-            mock_find = MagicMock()
-            mock_find.return_value = [mock_user]
-            mock_get_collection.return_value.find = mock_find
+        mock_user = {"username": "testuser", "email": test_email, "full_name": "", "roles": []}
 
-            mock_delete_one = MagicMock()
-            mock_get_collection.return_value.delete_one = mock_delete_one
+        with mock_users_collection() as collection:
+            mock_find_one_and_delete = AsyncMock(return_value=mock_user)
+            collection.find_one_and_delete = mock_find_one_and_delete
 
             response = client.delete(f"/users/{test_email}")
 
             assert response.status_code == 200
-            assert response.json() == {"message": f"User with email {test_email} deleted successfully"}
+            assert response.json() == {
+                "message": f"User with email {test_email} deleted successfully",
+                "user": mock_user
+            }
 
-            mock_get_collection.assert_called_with("users")
-            mock_find.assert_called_with({"email": test_email})
-            mock_delete_one.assert_called_with({"email": test_email})
+            mock_find_one_and_delete.assert_called_once_with(
+                {"email": test_email},
+                projection=UsersRepository.PUBLIC_PROJECTION
+            )
 
     def test_delete_user_database_error(self):
         """
         Test delete_user when a database error occurs.
         This tests the edge case where an unexpected exception is raised during the database operation.
         """
-        with patch('app.db.get_collection') as mock_get_collection:
-            mock_find = MagicMock()
-            mock_find.side_effect = Exception("Database connection error")
-            mock_get_collection.return_value.find = mock_find
+        with mock_users_collection() as collection:
+            collection.find_one_and_delete = AsyncMock(side_effect=Exception("Database connection error"))
 
             response = client.delete("/users/user@example.com")
 
             assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
             assert "Database connection error" in response.json()["detail"]
 
-    def test_delete_user_nonexistent(self):
+    def test_delete_user_nonexistent(self, live_client):
         """
         Test deleting a user that doesn't exist in the database.
 
@@ -149,7 +349,7 @@ class TestApp:
         the database.
         """
         non_existent_email = "nonexistent@example.com"
-        response = client.delete(f"/users/{non_existent_email}")
+        response = live_client.delete(f"/users/{non_existent_email}")
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert response.json() == {"detail": "No user found"}
 
@@ -158,27 +358,56 @@ class TestApp:
         Test delete_user when the user is not found in the database.
         This tests the edge case where the email provided does not match any user.
         """
-        with patch('app.db.get_collection') as mock_get_collection:
-            mock_find = MagicMock()
-            mock_find.return_value = []
-            mock_get_collection.return_value.find = mock_find
+        with mock_users_collection() as collection:
+            collection.find_one_and_delete = AsyncMock(return_value=None)
 
             response = client.delete("/users/nonexistent@example.com")
 
             assert response.status_code == status.HTTP_404_NOT_FOUND
             assert response.json() == {"detail": "No user found"}
 
-    def test_get_user_1(self):
+    def test_update_user_return_document(self):
+        """
+        Test that update_user with return_document=true answers with the
+        updated user from a single find_one_and_update.
+        """
+        updated_user = {"username": "newname", "email": "test@example.com", "full_name": "", "roles": ["user"]}
+
+        with mock_users_collection() as collection:
+            collection.find_one_and_update = AsyncMock(return_value=updated_user)
+            collection.update_one = AsyncMock()
+
+            response = client.put("/users/?email=test@example.com&return_document=true",
+                                  json={"username": "newname", "email": "test@example.com", "roles": ["user"]})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["user"] == updated_user
+        collection.update_one.assert_not_called()
+
+    def test_update_user_return_document_not_found(self):
+        """
+        Test that update_user with return_document=true returns 404 when no
+        user matches the email.
+        """
+        with mock_users_collection() as collection:
+            collection.find_one_and_update = AsyncMock(return_value=None)
+
+            response = client.put("/users/?email=missing@example.com&return_document=true",
+                                  json={"username": "newname", "email": "missing@example.com"})
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_get_user_1(self, live_client):
         """
         Test get_user when no user is found.
         This test verifies that the get_user function returns a 404 Not Found
         status code and the correct error message when no user matches the search criteria.
         """
-        response = client.get("/users/nonexistentuser")
+        response = live_client.get("/users/nonexistentuser")
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert response.json() == {"detail": "No user found"}
 
-    def test_get_user_2(self):
+    def test_get_user_2(self, live_client):
         """
         Test the get_user function when users are found.
 
@@ -189,7 +418,7 @@ class TestApp:
         3. Each user in the response has the expected structure
         """
         search = "test@example.com"
-        response = client.get(f"/users/{search}")
+        response = live_client.get(f"/users/{search}")
         assert response.status_code == 200
         assert isinstance(response.json(), list)
         assert len(response.json()) > 0
@@ -202,8 +431,8 @@ class TestApp:
         Test the get_user function when an unexpected exception occurs.
         This tests the explicit error handling for a 500 Internal Server Error scenario.
         """
-        with patch('app.db.get_collection') as mock_get_collection:
-            mock_get_collection.side_effect = Exception("Unexpected database error")
+        with mock_users_collection() as collection:
+            collection.find.side_effect = Exception("Unexpected database error")
 
             response = client.get("/users/test@example.com")
 
@@ -215,30 +444,267 @@ class TestApp:
         Test the get_user function when no user is found for the given search criteria.
         This tests the explicit error handling for a 404 Not Found scenario.
         """
-        with patch('app.db.get_collection') as mock_get_collection:
-            mock_find = MagicMock()
-            mock_find.return_value = []
-            mock_get_collection.return_value.find = mock_find
+        with mock_users_collection() as collection:
+            collection.find.return_value = AsyncCursorMock([])
 
             response = client.get("/users/nonexistent@example.com")
 
             assert response.status_code == 404
             assert response.json() == {"detail": "No user found"}
 
+    def test_get_user_served_from_cache_until_write(self):
+        """
+        Test that repeated lookups are answered from the cache and that
+        updating the user drops the cached lookup.
+        """
+        cache = UserCache(CacheSettings())
+        found_user = {"username": "testuser", "email": "test@example.com", "full_name": "", "roles": []}
+
+        with mock_users_collection(cache) as collection:
+            collection.find.side_effect = lambda *args: AsyncCursorMock([found_user])
+            collection.update_one = AsyncMock(return_value=MagicMock(matched_count=1, modified_count=1))
+
+            assert client.get("/users/testuser").json() == [found_user]
+            assert client.get("/users/testuser").json() == [found_user]
+            assert collection.find.call_count == 1
+
+            client.put("/users/?email=test@example.com", json={"username": "renamed", "email": "test@example.com"})
+            client.get("/users/testuser")
+            assert collection.find.call_count == 2
+
+        assert cache.metrics()["hits"] == 1
+        assert cache.metrics()["invalidations"] == 1
+
+    def test_get_user_does_not_cache_a_read_that_raced_a_write(self):
+        """
+        Test that a lookup read before an update but finished after it is
+        not cached, so the next lookup reads the updated user.
+        """
+        cache = UserCache(CacheSettings())
+        stored = {"username": "alice", "email": "alice@example.com", "full_name": "Old", "roles": []}
+        read_started, write_done = asyncio.Event(), asyncio.Event()
+
+        class BlockedCursor(AsyncCursorMock):
+            async def _iterate(self):
+                read_started.set()
+                await write_done.wait()
+                for document in self.documents:
+                    yield document
+
+        async def update_one(*args, **kwargs):
+            stored["full_name"] = "New"
+            return MagicMock(matched_count=1, modified_count=1)
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                raced = asyncio.create_task(http.get("/users/alice"))
+                await read_started.wait()
+                await http.put("/users/?email=alice@example.com",
+                               json={"username": "alice", "email": "alice@example.com", "full_name": "New"})
+                write_done.set()
+                await raced
+                return (await http.get("/users/alice")).json()
+
+        with mock_users_collection(cache) as collection:
+            # Each read sees the user as stored when the query was sent
+            collection.find.side_effect = lambda *args: BlockedCursor([dict(stored)])
+            collection.update_one = AsyncMock(side_effect=update_one)
+
+            after_write = asyncio.run(run())
+
+        assert after_write[0]["full_name"] == "New"
+        assert collection.find.call_count == 2
+
+    def test_unavailable_shared_cache_does_not_fail_requests(self):
+        """
+        Test that with the shared cache down, a created user is still
+        answered with 201 and lookups are read from MongoDB.
+        """
+        shared = MagicMock(spec=SharedCache)
+        for name in ("get", "set", "invalidate", "clear", "generation", "bump_generation", "publish"):
+            getattr(shared, name).side_effect = ConnectionError("redis down")
+        cache = UserCache(CacheSettings(redis_url="redis://shared"), shared)
+        found_user = {"username": "testuser", "email": "test@example.com", "full_name": "", "roles": []}
+
+        with mock_users_collection(cache) as collection:
+            collection.insert_one = AsyncMock(return_value=MagicMock(inserted_id=ObjectId()))
+            collection.find.side_effect = lambda *args: AsyncCursorMock([found_user])
+
+            created = client.post("/users/", json={"username": "testuser", "email": "test@example.com"})
+            found = client.get("/users/testuser")
+            collection.find.side_effect = None
+            listed = client.get("/users/")
+
+        assert created.status_code == status.HTTP_201_CREATED
+        assert found.status_code == status.HTTP_200_OK
+        assert found.json() == [found_user]
+        assert listed.status_code == status.HTTP_200_OK
+
+    def test_get_user_honours_if_none_match(self):
+        """
+        Test that user lookups carry an ETag and that repeating the request
+        with that ETag in If-None-Match returns 304 with an empty body.
+        """
+        found_user = {"username": "testuser", "email": "test@example.com", "full_name": "", "roles": []}
+
+        with mock_users_collection() as collection:
+            collection.find.side_effect = lambda *args: AsyncCursorMock([found_user])
+
+            response = client.get("/users/testuser")
+            etag = response.headers["ETag"]
+            not_modified = client.get("/users/testuser", headers={"If-None-Match": etag})
+            stale = client.get("/users/testuser", headers={"If-None-Match": '"stale"'})
+
+        assert response.json() == [found_user]
+        assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+        assert not_modified.content == b""
+        assert not_modified.headers["ETag"] == etag
+        assert stale.status_code == status.HTTP_200_OK
+        assert stale.json() == [found_user]
+
     def test_get_users_database_error(self):
         """
         Test the get_users endpoint when a database error occurs.
         This test verifies that the method handles exceptions and returns a 500 Internal Server Error.
         """
-        with patch('app.db.get_collection') as mock_get_collection:
-            mock_get_collection.return_value.find.side_effect = Exception("Database error")
+        with mock_users_collection() as collection:
+            collection.find.side_effect = Exception("Database error")
 
             response = client.get("/users/")
 
             assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
             assert "Database error" in response.json()["detail"]
 
-    def test_get_users_returns_list_of_users(self):
+    def test_get_users_pages_by_id(self):
+        """
+        Test that get_users reads one extra user to detect the next page and
+        returns an opaque cursor that resumes after the last returned _id.
+        """
+        ids = [ObjectId() for _ in range(3)]
+        users = [{"_id": user_id, "username": f"user{i}", "email": f"user{i}@example.com",
+                  "full_name": "", "roles": []} for i, user_id in enumerate(ids)]
+
+        with mock_users_collection() as collection:
+            collection.find.return_value.sort.return_value.limit.return_value = AsyncCursorMock(users)
+
+            response = client.get("/users/?limit=2")
+
+            assert response.status_code == status.HTTP_200_OK
+            assert [user["username"] for user in response.json()] == ["user0", "user1"]
+            collection.find.assert_called_with({}, UsersRepository.projection(include_id=True))
+            collection.find.return_value.sort.return_value.limit.assert_called_with(3)
+
+            next_cursor = response.headers[PaginationLimits.NEXT_CURSOR_HEADER]
+            collection.find.return_value.sort.return_value.limit.return_value = AsyncCursorMock(users[2:])
+
+            response = client.get(f"/users/?limit=2&after={next_cursor}")
+
+            assert [user["username"] for user in response.json()] == ["user2"]
+            assert PaginationLimits.NEXT_CURSOR_HEADER not in response.headers
+            collection.find.assert_called_with({"_id": {"$gt": ids[1]}}, UsersRepository.projection(include_id=True))
+
+    def test_get_users_validates_stored_users_once(self):
+        """
+        Test that a page is validated as a whole without building a
+        UserResponse per document, and that a malformed document still fails.
+        """
+        users = [{"username": "user0", "email": "user0@example.com", "full_name": "", "roles": []}]
+
+        with mock_users_collection() as collection, \
+                patch("app.UserResponse.model_validate") as model_validate:
+            collection.find.return_value.sort.return_value.limit.return_value = AsyncCursorMock(users)
+            response = client.get("/users/")
+
+            collection.find.return_value.sort.return_value.limit.return_value = AsyncCursorMock([{"username": "user1"}])
+            broken = client.get("/users/")
+
+        assert response.json() == users
+        model_validate.assert_not_called()
+        assert broken.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+
+    def test_get_users_invalid_cursor(self):
+        """
+        Test that a malformed after cursor is rejected with 400 Bad Request.
+        """
+        with mock_users_collection():
+            response = client.get("/users/?after=not-a-cursor")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_get_users_limit_is_capped(self):
+        """
+        Test that page sizes above the server-side maximum are rejected.
+        """
+        with mock_users_collection():
+            response = client.get(f"/users/?limit={PaginationLimits.MAX_PAGE_SIZE + 1}")
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_get_users_ndjson_streams_every_user(self):
+        """
+        Test that format=ndjson streams one JSON document per line for the
+        whole collection, reading the cursor with the export batch size.
+        """
+        users = [{"_id": ObjectId(), "username": f"user{i}", "email": f"user{i}@example.com",
+                  "full_name": "", "roles": [], "is_active": True} for i in range(3)]
+
+        with mock_users_collection() as collection:
+            collection.find.return_value.sort.return_value.batch_size.return_value = AsyncCursorMock(users)
+
+            response = client.get("/users/?format=ndjson")
+
+            collection.find.return_value.sort.return_value.batch_size.assert_called_with(
+                UsersRepository.STREAM_BATCH_SIZE)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines == [{"username": f"user{i}", "email": f"user{i}@example.com",
+                          "full_name": "", "roles": []} for i in range(3)]
+
+    def test_get_user_fields_narrow_projection(self):
+        """
+        Test that fields= is pushed down as the query projection and only the
+        requested fields are returned.
+        """
+        with mock_users_collection() as collection:
+            collection.find.return_value = AsyncCursorMock([{"email": "test@example.com"}])
+
+            response = client.get("/users/testuser?fields=email")
+
+            collection.find.assert_called_once_with(
+                {"$or": [{"email": "testuser"}, {"username": "testuser"}]},
+                {"_id": 0, "email": 1}
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == [{"email": "test@example.com"}]
+
+    def test_get_user_unknown_field(self):
+        """
+        Test that asking for a field outside UserResponse is rejected with 400.
+        """
+        with mock_users_collection():
+            response = client.get("/users/testuser?fields=email,password")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json() == {"detail": "Unknown fields: password"}
+
+    @pytest.mark.parametrize("fields", ["", ",", " , "])
+    def test_get_users_empty_fields(self, fields):
+        """
+        Test that an empty field list is rejected with 400 instead of
+        fetching whole documents and returning empty users.
+        """
+        with mock_users_collection() as collection:
+            response = client.get("/users/", params={"fields": fields})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json() == {"detail": "fields must name at least one field"}
+        collection.find.assert_not_called()
+
+    def test_get_users_returns_list_of_users(self, live_client):
         """
         Test that the get_users endpoint returns a list of users successfully.
 
@@ -247,7 +713,7 @@ class TestApp:
         2. The response contains a list of users
         3. Each user in the list has the expected structure (id, username, email)
         """
-        response = client.get("/users/")
+        response = live_client.get("/users/")
         assert response.status_code == 200
         users = response.json()
         assert isinstance(users, list)
@@ -274,3 +740,69 @@ class TestApp:
         response = client.get("/")
         assert response.status_code == 200
         assert response.json() == {"message": "Welcome to the Fast API with MongoDB !"}
+
+    def test_default_response_encodes_bson_types(self):
+        """
+        Test that the default response class renders ObjectId and datetime
+        values, which the standard JSON encoder rejects.
+        """
+        object_id = ObjectId()
+        response = FastJSONResponse({"_id": object_id, "signup_ts": datetime(2023, 1, 1)})
+
+        assert json.loads(response.body) == {"_id": str(object_id), "signup_ts": "2023-01-01T00:00:00"}
+        assert response.media_type == "application/json"
+
+    def test_user_import_needs_a_known_format(self):
+        """
+        Test that an upload that is neither CSV nor NDJSON is rejected with
+        415 and that unknown import jobs are 404.
+        """
+        with mock_users_collection(), mock_import_jobs(None):
+            response = client.post("/users/import", content=b"{}", headers={"Content-Type": "application/json"})
+
+            assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            assert client.get("/users/import/unknown").status_code == status.HTTP_404_NOT_FOUND
+            assert client.get("/users/import/unknown/errors").status_code == status.HTTP_404_NOT_FOUND
+
+    def test_user_import_status_is_read_from_the_database(self):
+        """
+        Test that the status and rejected rows of an import are served from
+        MongoDB, so a worker that is not running the import can answer.
+        """
+        stored = {"id": "job1", "format": "csv", "state": "running", "rows": 3, "failed": 1,
+                  "worker": "other-host:42", "created_at": datetime(2023, 1, 1), "updated_at": datetime(2023, 1, 1)}
+        errors = [{"line": 3, "error": "Invalid email"}]
+
+        with mock_import_jobs(stored, errors) as (collection, errors_collection):
+            response = client.get("/users/import/job1")
+            errors_response = client.get("/users/import/job1/errors")
+
+        assert response.status_code == 200
+        assert response.json()["worker"] == "other-host:42"
+        assert response.json()["failed"] == 1
+        collection.find_one.assert_awaited_with({"_id": "job1"}, {"_id": 0})
+        assert errors_response.status_code == 200
+        assert [json.loads(line) for line in errors_response.text.splitlines()] == errors
+        errors_collection.find.assert_called_once_with({"job_id": "job1"}, {"_id": 0, "line": 1, "error": 1})
+
+    def test_user_export_status_is_read_from_the_database(self):
+        """
+        Test that an export status is served from MongoDB, so a worker that
+        is not running the export can answer, and that unknown exports are 404.
+        """
+        stored = {"id": "job1", "format": "ndjson", "state": "succeeded", "directory": "exports/job1",
+                  "documents": 250, "worker": "other-host:42", "created_at": datetime(2023, 1, 1),
+                  "updated_at": datetime(2023, 1, 1)}
+        collection = MagicMock()
+        collection.find_one = AsyncMock(side_effect=lambda query, projection: stored if query["_id"] == "job1" else None)
+        app.dependency_overrides[get_export_jobs_repository] = lambda: JobsRepository(collection)
+        try:
+            response = client.get("/users/export/job1")
+            unknown = client.get("/users/export/unknown")
+        finally:
+            app.dependency_overrides.pop(get_export_jobs_repository, None)
+
+        assert response.status_code == 200
+        assert response.json()["documents"] == 250
+        assert response.json()["worker"] == "other-host:42"
+        assert unknown.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,556 @@
+from bson import ObjectId
+from cache.batching import BatchLoader
+from cache.change_stream import UserChangeStreamInvalidator
+from cache.etag import etag_matches, make_etag
+from cache.memory import MemoryCache
+from cache.settings import CacheSettings
+from cache.shared import RedisCache, SharedCache
+from cache.single_flight import SingleFlight
+from cache.users import CachedBody, UserCache
+from unittest.mock import AsyncMock, MagicMock
+import asyncio
+import json
+import os
+import pytest
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMemoryCache:
+
+    def test_evicts_least_recently_used(self):
+        """
+        Test that the cache keeps at most max_size entries and evicts the
+        least recently used one first.
+        """
+        cache = MemoryCache(max_size=2, ttl_seconds=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.evictions == 1
+
+    def test_entries_expire_after_ttl(self):
+        """
+        Test that an entry older than the TTL is reported as a miss.
+        """
+        clock = FakeClock()
+        cache = MemoryCache(max_size=10, ttl_seconds=5, clock=clock)
+        cache.set("a", 1)
+
+        clock.now = 4.9
+        assert cache.get("a") == 1
+        clock.now = 5.0
+        assert cache.get("a") is None
+        assert cache.expirations == 1
+        assert len(cache) == 0
+
+    def test_invalidate_tag_drops_every_tagged_entry(self):
+        """
+        Test that invalidating a tag drops all entries stored with it, and
+        only those.
+        """
+        cache = MemoryCache(max_size=10, ttl_seconds=60)
+        cache.set("johndoe", ["john"], tags=["john@example.com"])
+        cache.set("john@example.com", ["john"], tags=["john@example.com"])
+        cache.set("jane", ["jane"], tags=["jane@example.com"])
+
+        cache.invalidate_tag("john@example.com")
+
+        assert cache.get("johndoe") is None
+        assert cache.get("john@example.com") is None
+        assert cache.get("jane") == ["jane"]
+        assert cache.invalidations == 2
+
+
+class TestETag:
+
+    def test_etag_tracks_body(self):
+        """
+        Test that ETags are quoted, stable for a body and differ between bodies.
+        """
+        assert make_etag(b"[]") == make_etag(b"[]")
+        assert make_etag(b"[]") != make_etag(b"[{}]")
+        assert make_etag(b"[]").startswith('"') and make_etag(b"[]").endswith('"')
+
+    def test_if_none_match_lists_and_wildcards(self):
+        """
+        Test that If-None-Match matches any listed tag, weak or strong, and *.
+        """
+        etag = make_etag(b"[]")
+
+        assert etag_matches(f'"other", W/{etag}', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches('"other"', etag)
+        assert not etag_matches(None, etag)
+
+
+class TestSingleFlight:
+
+    def test_concurrent_calls_share_one_execution(self):
+        """
+        Test that concurrent calls with the same key run once and all get
+        its result, while other keys run on their own.
+        """
+        flight = SingleFlight()
+        executions = []
+
+        async def lookup(key):
+            executions.append(key)
+            await asyncio.sleep(0.01)
+            return key.upper()
+
+        async def run():
+            return await asyncio.gather(
+                *(flight.run("john", lambda: lookup("john")) for _ in range(10)),
+                flight.run("jane", lambda: lookup("jane")),
+            )
+
+        results = asyncio.run(run())
+
+        assert results == ["JOHN"] * 10 + ["JANE"]
+        assert executions == ["john", "jane"]
+        assert flight.metrics() == {"calls": 11, "executed": 2, "coalesced": 9, "in_flight": 0}
+
+    def test_errors_reach_every_waiter_and_are_not_cached(self):
+        """
+        Test that a failed call raises in every waiter and that the next call
+        after it runs again.
+        """
+        flight = SingleFlight()
+        lookup = AsyncMock(side_effect=[RuntimeError("down"), "john"])
+
+        async def run():
+            failed = await asyncio.gather(*(flight.run("john", lookup) for _ in range(3)), return_exceptions=True)
+            return failed, await flight.run("john", lookup)
+
+        failed, retried = asyncio.run(run())
+
+        assert all(isinstance(error, RuntimeError) for error in failed)
+        assert retried == "john"
+        assert lookup.await_count == 2
+
+    def test_cancelled_caller_does_not_cancel_the_others(self):
+        """
+        Test that cancelling the caller that started a call leaves it running
+        for the callers that joined it.
+        """
+        flight = SingleFlight()
+
+        async def lookup():
+            await asyncio.sleep(0.02)
+            return "john"
+
+        async def run():
+            first = asyncio.ensure_future(flight.run("john", lookup))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(flight.run("john", lookup))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        assert asyncio.run(run()) == "john"
+
+
+class TestBatchLoader:
+
+    def test_loads_within_the_window_share_one_call(self):
+        """
+        Test that distinct keys loaded within the window go out as one batch
+        and every caller gets the value for its own key.
+        """
+        load_many = AsyncMock(side_effect=lambda keys: {key: key.upper() for key in keys})
+        loader = BatchLoader(load_many, window_seconds=0.01, max_keys=100)
+
+        async def run():
+            return await asyncio.gather(loader.load("john"), loader.load("jane"), loader.load("john"))
+
+        assert asyncio.run(run()) == ["JOHN", "JANE", "JOHN"]
+        load_many.assert_awaited_once_with(["john", "jane"])
+        assert loader.metrics()["batches"] == 1
+        assert loader.metrics()["keys"] == 2
+
+    def test_full_batch_is_sent_without_waiting(self):
+        """
+        Test that reaching max_keys sends the batch at once and the next key
+        starts a new one.
+        """
+        load_many = AsyncMock(side_effect=lambda keys: {key: key for key in keys})
+        loader = BatchLoader(load_many, window_seconds=60, max_keys=2)
+
+        async def run():
+            first = await asyncio.gather(loader.load("a"), loader.load("b"))
+            third = asyncio.ensure_future(loader.load("c"))
+            await asyncio.sleep(0)
+            await loader.close()
+            return first, await third
+
+        assert asyncio.run(run()) == (["a", "b"], "c")
+        assert [call.args[0] for call in load_many.await_args_list] == [["a", "b"], ["c"]]
+        assert loader.metrics()["full_batches"] == 1
+
+    def test_failed_batch_fails_every_caller(self):
+        """
+        Test that an error from load_many reaches every caller in the batch.
+        """
+        loader = BatchLoader(AsyncMock(side_effect=RuntimeError("down")), window_seconds=0.001, max_keys=100)
+
+        async def run():
+            return await asyncio.gather(loader.load("a"), loader.load("b"), return_exceptions=True)
+
+        assert all(isinstance(error, RuntimeError) for error in asyncio.run(run()))
+
+
+class TestSharedUserCache:
+
+    @staticmethod
+    def worker_cache(server):
+        """A UserCache as one worker sees it, on a shared fake Redis server"""
+        fakeredis = pytest.importorskip("fakeredis")
+        shared = RedisCache(fakeredis.FakeAsyncRedis(server=server), "test-users")
+        return UserCache(CacheSettings(redis_url="redis://shared"), shared)
+
+    def test_lookup_written_by_one_worker_is_served_to_another(self):
+        """
+        Test that a lookup cached by one worker is found, pre-serialized, by
+        another, and that a write in either worker drops it for both tiers.
+        """
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+        first, second = self.worker_cache(server), self.worker_cache(server)
+        user = {"username": "johndoe", "email": "john.doe@example.com", "full_name": "", "roles": []}
+
+        async def run():
+            stored = await first.set("johndoe", [user], await first.lookup_generation())
+            served = await second.get("johndoe")
+            await second.invalidate_user("john.doe@example.com")
+            return stored, served, await second.get("johndoe")
+
+        stored, served, after_write = asyncio.run(run())
+
+        assert served == stored
+        assert json.loads(served.body) == [user]
+        assert after_write is None
+
+    def test_lookup_read_before_another_workers_write_is_not_stored(self):
+        """
+        Test that a lookup read before a write in another worker, but stored
+        after it, is kept out of both tiers.
+        """
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+        reader, writer = self.worker_cache(server), self.worker_cache(server)
+        user = {"username": "johndoe", "email": "john.doe@example.com", "full_name": "Old", "roles": []}
+
+        async def run():
+            generation = await reader.lookup_generation()
+            await writer.invalidate_user("john.doe@example.com", "johndoe")
+            await reader.set("johndoe", [user], generation)
+            return reader.memory.get("johndoe"), await writer.get("johndoe")
+
+        assert asyncio.run(run()) == (None, None)
+
+    def test_lookup_is_evicted_by_user_id(self):
+        """
+        Test that a lookup is tagged with the _id of the users it returned,
+        so evicting by _id drops it from both tiers of every worker.
+        """
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+        first, second = self.worker_cache(server), self.worker_cache(server)
+        user_id = ObjectId()
+        user = {"_id": user_id, "username": "johndoe", "email": "john.doe@example.com", "full_name": "", "roles": []}
+
+        async def run():
+            stored = await first.set("johndoe", [user], await first.lookup_generation())
+            served = await second.get("johndoe")
+            await first.invalidate_users([], ids=[user_id], publish=False)
+            return stored, served, first.memory.get("johndoe"), await second.shared.get("lookup:johndoe")
+
+        stored, served, local, shared = asyncio.run(run())
+
+        assert served == stored
+        assert stored.tags == ("john.doe@example.com", f"id:{user_id}")
+        assert "_id" not in json.loads(stored.body)[0]
+        assert (local, shared) == (None, None)
+
+    def test_unavailable_shared_tier_degrades_to_misses(self):
+        """
+        Test that errors of the shared tier are logged and counted instead
+        of raised: reads are misses, fills are skipped, and a failed
+        invalidation clears this worker and bypasses the shared tier.
+        """
+        shared = MagicMock(spec=SharedCache)
+        for name in ("get", "set", "invalidate", "clear", "generation", "bump_generation", "publish"):
+            getattr(shared, name).side_effect = ConnectionError("redis down")
+        cache = UserCache(CacheSettings(redis_url="redis://shared"), shared)
+        user = {"username": "johndoe", "email": "john.doe@example.com", "full_name": "", "roles": []}
+
+        async def run():
+            cache.memory.set("janedoe", CachedBody.of(b"[]"), tags=["jane.doe@example.com"])
+            stored = await cache.set("johndoe", [user], await cache.lookup_generation())
+            missed = await cache.get("johndoe")
+            page_key = await cache.page_key(":100")
+            await cache.invalidate_user("john.doe@example.com")
+            await cache.invalidate_all()
+            return stored, missed, page_key
+
+        stored, missed, page_key = asyncio.run(run())
+
+        assert json.loads(stored.body) == [user]
+        assert (missed, page_key) == (None, None)
+        assert len(cache.memory) == 0
+        metrics = cache.metrics()["shared"]
+        assert metrics["errors"] == 5
+        assert metrics["bypassed"] is True
+
+    def test_pages_are_keyed_by_write_generation(self):
+        """
+        Test that a listing page stored before a write is no longer found
+        after it, because the write bumps the generation.
+        """
+        fakeredis = pytest.importorskip("fakeredis")
+        cache = self.worker_cache(fakeredis.FakeServer())
+
+        async def run():
+            key = await cache.page_key(":100")
+            await cache.set_page(key, CachedBody.of(b"[]", "cursor"))
+            cached = await cache.get_page(await cache.page_key(":100"))
+            await cache.invalidate_user("john.doe@example.com")
+            return cached, await cache.get_page(await cache.page_key(":100"))
+
+        cached, after_write = asyncio.run(run())
+
+        assert cached == CachedBody.of(b"[]", "cursor")
+        assert after_write is None
+
+    def test_published_invalidations_reach_other_workers(self):
+        """
+        Test that a write in one worker evicts the lookup from the
+        in-process tier of another worker through the invalidation channel.
+        """
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+        writer, reader = self.worker_cache(server), self.worker_cache(server)
+        user = {"username": "johndoe", "email": "john.doe@example.com", "full_name": "", "roles": []}
+
+        async def run():
+            reader.start()
+            await reader.set("johndoe", [user], await reader.lookup_generation())
+            # Let the subscriber connect before anything is published
+            await asyncio.sleep(0.05)
+            await writer.invalidate_user("john.doe@example.com")
+            for _ in range(50):
+                if reader.memory.get("johndoe") is None:
+                    break
+                await asyncio.sleep(0.01)
+            await reader.close()
+            return reader.memory.get("johndoe")
+
+        assert asyncio.run(run()) is None
+
+
+class FakeChangeStream:
+    """Async change stream over a list of events that closes after an invalidate event"""
+
+    def __init__(self, events):
+        self.events = list(events)
+        self.alive = True
+        self.resume_token = None
+
+    async def try_next(self):
+        if not self.events:
+            await asyncio.sleep(0.01)
+            return None
+        event = self.events.pop(0)
+        self.resume_token = {"_data": event["_id"]}
+        if event["operationType"] == "invalidate":
+            self.alive = False
+        return event
+
+    async def close(self):
+        self.alive = False
+
+
+class TestUserChangeStreamInvalidator:
+
+    @staticmethod
+    def invalidator():
+        cache = MagicMock()
+        cache.invalidate_users = AsyncMock()
+        cache.invalidate_all = AsyncMock()
+        return UserChangeStreamInvalidator(MagicMock(), MagicMock(), cache, "test"), cache
+
+    def test_update_invalidates_users_from_both_images(self):
+        """
+        Test that an update drops the cached reads of the user as it was
+        before and after the change.
+        """
+        invalidator, cache = self.invalidator()
+
+        asyncio.run(invalidator.handle({
+            "operationType": "update",
+            "documentKey": {"_id": 1},
+            "fullDocumentBeforeChange": {"email": "old@example.com", "username": "olduser"},
+            "fullDocument": {"email": "new@example.com", "username": "newuser"},
+            "updateDescription": {"updatedFields": {"email": "new@example.com"}},
+        }))
+
+        cache.invalidate_users.assert_called_once_with(
+            [("old@example.com", "olduser"), ("new@example.com", "newuser")], ids=[1], publish=False)
+        cache.invalidate_all.assert_not_called()
+
+    def test_update_without_pre_image_keeps_tagged_entries_precise(self):
+        """
+        Test that without a pre-image an update that keeps the email is
+        still handled by tag, since entries are tagged by email.
+        """
+        invalidator, cache = self.invalidator()
+
+        asyncio.run(invalidator.handle({
+            "operationType": "update",
+            "documentKey": {"_id": 1},
+            "fullDocument": {"email": "john@example.com", "username": "renamed"},
+            "updateDescription": {"updatedFields": {"username": "renamed"}, "removedFields": []},
+        }))
+
+        cache.invalidate_users.assert_called_once_with([("john@example.com", "renamed")], ids=[1], publish=False)
+
+    @pytest.mark.parametrize("change", [
+        {"operationType": "delete", "documentKey": {"_id": 1}},
+        {"operationType": "update", "documentKey": {"_id": 1}, "fullDocument": {"email": "new@example.com"},
+         "updateDescription": {"updatedFields": {"email": "new@example.com"}}},
+    ])
+    def test_unknown_identity_is_evicted_by_id(self, change):
+        """
+        Test that changes whose old email cannot be known without a
+        pre-image are evicted by the _id tag, not by flushing the cache.
+        """
+        invalidator, cache = self.invalidator()
+
+        asyncio.run(invalidator.handle(change))
+
+        assert cache.invalidate_users.call_args.kwargs["ids"] == [1]
+        cache.invalidate_all.assert_not_called()
+
+    def test_collection_wide_events_flush_cache(self):
+        """
+        Test that collection-wide events such as drop flush the whole cache.
+        """
+        invalidator, cache = self.invalidator()
+
+        asyncio.run(invalidator.handle({"operationType": "drop"}))
+
+        cache.invalidate_all.assert_called_once_with(publish=False)
+
+    def test_invalidated_stream_is_left_and_not_resumed(self):
+        """
+        Test that follow returns once a drop closes the stream, and that the
+        invalidate event's token is dropped, since it cannot be resumed after.
+        """
+        invalidator, cache = self.invalidator()
+        stream = FakeChangeStream([{"_id": "drop", "operationType": "drop"},
+                                   {"_id": "invalidate", "operationType": "invalidate"}])
+        invalidator.collection.watch = AsyncMock(return_value=stream)
+        invalidator.state_collection.update_one = AsyncMock()
+        invalidator.state_collection.delete_one = AsyncMock()
+        invalidator.resume_token = {"_data": "before"}
+
+        asyncio.run(asyncio.wait_for(invalidator.follow(), timeout=1))
+
+        assert invalidator.events == 2
+        assert invalidator.resume_token is None
+        invalidator.state_collection.delete_one.assert_called_once_with({"_id": "test"})
+        assert cache.invalidate_all.await_count == 2
+
+    def test_closed_stream_is_left(self):
+        """
+        Test that follow returns when the stream is closed without an
+        event, instead of spinning on try_next.
+        """
+        invalidator, _ = self.invalidator()
+        stream = FakeChangeStream([])
+        stream.alive = False
+        invalidator.collection.watch = AsyncMock(return_value=stream)
+
+        asyncio.run(asyncio.wait_for(invalidator.follow(), timeout=1))
+
+        assert invalidator.events == 0
+
+    def test_start_up_failure_is_retried(self):
+        """
+        Test that failing to load the resume token at start-up is retried
+        rather than ending the task, and that metrics report it running.
+        """
+        invalidator, cache = self.invalidator()
+        invalidator.RETRY_DELAY_SECONDS = 0
+        invalidator.state_collection.find_one = AsyncMock(side_effect=[RuntimeError("unreachable"), None])
+        invalidator.collection.watch = AsyncMock(return_value=FakeChangeStream([]))
+
+        async def run():
+            invalidator.start()
+            for _ in range(100):
+                if invalidator.collection.watch.await_count:
+                    break
+                await asyncio.sleep(0.01)
+            metrics = invalidator.metrics()
+            invalidator.task.cancel()
+            await asyncio.gather(invalidator.task, return_exceptions=True)
+            return metrics, invalidator.metrics()
+
+        running, stopped = asyncio.run(run())
+
+        assert invalidator.state_collection.find_one.await_count == 2
+        assert running["running"] is True
+        assert stopped["running"] is False
+        cache.invalidate_all.assert_awaited_with(publish=False)
+
+    @pytest.mark.skipif("MONGODB_REPLSET_URL" not in os.environ,
+                        reason="needs a replica set, e.g. mongod --replSet rs0 then rs.initiate()")
+    def test_external_write_evicts_entry_and_token_survives_restart(self):
+        """
+        Test against a local single-node replica set that a write made
+        directly on the collection evicts the cached lookup and that the
+        resume token is persisted for the next run.
+        """
+        from pymongo import AsyncMongoClient
+
+        async def run():
+            client = AsyncMongoClient(os.environ["MONGODB_REPLSET_URL"])
+            db = client.get_database("fastapi-mongodb-test")
+            users, state = db.get_collection("users"), db.get_collection("change_stream_state")
+            await users.delete_many({})
+            await state.delete_many({})
+            cache = UserCache(CacheSettings())
+            invalidator = UserChangeStreamInvalidator(users, state, cache, "test")
+            invalidator.SAVE_INTERVAL_SECONDS = 0
+            user = {"username": "johndoe", "email": "john.doe@example.com", "full_name": "", "roles": []}
+            try:
+                invalidator.start()
+                await asyncio.sleep(1)
+                await cache.set("johndoe", [user], await cache.lookup_generation())
+                await users.insert_one(dict(user))
+                await users.update_one({"email": user.email}, {"$set": {"full_name": "John"}})
+                for _ in range(50):
+                    if cache.memory.get("johndoe") is None and invalidator.events >= 2:
+                        break
+                    await asyncio.sleep(0.1)
+                await invalidator.stop()
+                return cache.memory.get("johndoe"), await state.find_one({"_id": "test"})
+            finally:
+                await client.close()
+
+        cached, saved_state = asyncio.run(run())
+
+        assert cached is None
+        assert saved_state["resume_token"] is not None
@@ -0,0 +1,256 @@
+from cache.change_stream import UserChangeStreamInvalidator
+from database.connection import MongoConnection
+from database.executor import DatabaseExecutor
+from database.indexes import IndexManager
+from database.offload import Offloaded
+from database.settings import DatabaseSettings
+from pymongo import IndexModel
+from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+import threading
+import time
+import pytest
+
+
+class TestDatabaseSettings:
+
+    def test_from_env_reads_pool_settings(self):
+        """
+        Test that pool settings are read from MONGODB_* variables and
+        coerced to the declared types.
+        """
+        settings = DatabaseSettings.from_env({
+            "MONGODB_URL": "mongodb://localhost:27017",
+            "MONGODB_MAX_POOL_SIZE": "50",
+            "MONGODB_MIN_POOL_SIZE": "5",
+            "MONGODB_WAIT_QUEUE_TIMEOUT_MS": "2000",
+        })
+
+        assert settings.max_pool_size == 50
+        assert settings.min_pool_size == 5
+        assert settings.wait_queue_timeout_ms == 2000
+
+    def test_client_options_skip_unset_values(self):
+        """
+        Test that optional settings left unset are not passed to the driver,
+        so the driver defaults still apply.
+        """
+        settings = DatabaseSettings.from_env({"MONGODB_URL": "mongodb://localhost:27017"})
+
+        options = settings.client_options()
+
+        assert "maxIdleTimeMS" not in options
+        assert "waitQueueTimeoutMS" not in options
+        assert options["maxPoolSize"] == 100
+
+    def test_from_env_requires_url(self):
+        """
+        Test that a missing MONGODB_URL is reported as a validation error.
+        """
+        with pytest.raises(ValueError):
+            DatabaseSettings.from_env({})
+
+
+class TestMongoConnection:
+
+    def test_warmup_is_bounded_by_timeout(self):
+        """
+        Test that a warm-up probe against an unresponsive server gives up
+        after warmup_timeout_ms instead of waiting for server selection.
+        """
+        settings = DatabaseSettings(url="mongodb://localhost:27017", warmup=True, warmup_timeout_ms=50)
+        connection = MongoConnection(settings)
+
+        async def hang():
+            await asyncio.sleep(10)
+
+        with patch.object(MongoConnection, "db") as mock_db:
+            mock_db.list_collection_names = MagicMock(side_effect=hang)
+
+            async def run():
+                loop = asyncio.get_running_loop()
+                started = loop.time()
+                await connection.warmup()
+                return loop.time() - started
+
+            elapsed = asyncio.run(run())
+
+        assert elapsed < 1
+
+
+class FakeCursor:
+    """Synchronous cursor over a list that records the threads it is read from"""
+
+    def __init__(self, documents, threads):
+        self.documents = iter(documents)
+        self.threads = threads
+
+    def sort(self, *args):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.threads.add(threading.current_thread().name)
+        return next(self.documents)
+
+
+class FakeChangeStream:
+    """Synchronous change stream over a list of events that records the threads it is read from"""
+
+    def __init__(self, events, threads):
+        self.events = list(events)
+        self.threads = threads
+        self.resume_token = None
+        self.alive = True
+
+    def try_next(self):
+        self.threads.add(threading.current_thread().name)
+        if not self.events:
+            # The server holds an empty getMore for up to max_await_time_ms
+            time.sleep(0.01)
+            return None
+        event = self.events.pop(0)
+        self.resume_token = {"_data": event["_id"]}
+        return event
+
+    def close(self):
+        pass
+
+
+class FakeCollection:
+    """Synchronous collection that records the threads it is called from"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.threads = set()
+
+    def find_one(self, query):
+        self.threads.add(threading.current_thread().name)
+        return self.documents[0]
+
+    def find(self, query=None):
+        return FakeCursor(self.documents, self.threads)
+
+    def watch(self, **kwargs):
+        return FakeChangeStream(self.documents, self.threads)
+
+
+class TestOffloaded:
+
+    def test_calls_run_on_executor_threads(self):
+        """
+        Test that both direct calls and cursor iteration run on the executor's
+        threads, never on the event loop thread, and are reported in metrics.
+        """
+        documents = [{"email": f"user{i}@example.com"} for i in range(250)]
+        collection = FakeCollection(documents)
+        executor = DatabaseExecutor(max_workers=2)
+        offloaded = Offloaded(collection, executor)
+
+        async def run():
+            first = await offloaded.find_one({})
+            found = [document async for document in offloaded.find({}).sort("_id")]
+            return first, found
+
+        try:
+            first, found = asyncio.run(run())
+        finally:
+            executor.shutdown()
+
+        assert first == documents[0]
+        assert found == documents
+        assert collection.threads and all(name.startswith("mongo") for name in collection.threads)
+        metrics = executor.metrics()
+        assert metrics["queue_depth"] == 0
+        assert metrics["active_workers"] == 0
+        # one find_one plus three chunks and the final empty read
+        assert metrics["completed"] == 5
+
+    def test_to_list_respects_length(self):
+        """
+        Test that to_list stops reading once the requested length is reached.
+        """
+        collection = FakeCollection([{"n": i} for i in range(10)])
+        executor = DatabaseExecutor(max_workers=1)
+
+        try:
+            found = asyncio.run(Offloaded(collection, executor).find({}).to_list(length=3))
+        finally:
+            executor.shutdown()
+
+        assert found == [{"n": 0}, {"n": 1}, {"n": 2}]
+
+    def test_change_stream_is_read_on_executor_threads(self):
+        """
+        Test that the change stream invalidator works on the threaded driver:
+        try_next is awaited on the executor's threads and the resume token
+        is still exposed.
+        """
+        events = [{"_id": "token-1", "operationType": "insert", "documentKey": {"_id": 1},
+                   "fullDocument": {"email": "john.doe@example.com", "username": "johndoe"}}]
+        collection = FakeCollection(events)
+        executor = DatabaseExecutor(max_workers=2)
+        cache = MagicMock()
+        cache.invalidate_users = AsyncMock()
+        cache.invalidate_all = AsyncMock()
+        state = MagicMock()
+        state.update_one = AsyncMock()
+        invalidator = UserChangeStreamInvalidator(Offloaded(collection, executor), state, cache, "test")
+
+        async def run():
+            follow = asyncio.create_task(invalidator.follow())
+            while invalidator.events == 0 and not follow.done():
+                await asyncio.sleep(0.01)
+            follow.cancel()
+            await asyncio.gather(follow, return_exceptions=True)
+
+        try:
+            asyncio.run(run())
+        finally:
+            executor.shutdown()
+
+        assert invalidator.events == 1
+        cache.invalidate_users.assert_called_once_with([("john.doe@example.com", "johndoe")], ids=[1],
+                                                      publish=False)
+        assert invalidator.resume_token == {"_data": "token-1"}
+        assert collection.threads and all(name.startswith("mongo") for name in collection.threads)
+
+
+class TestIndexManager:
+
+    def test_drift_reports_missing_changed_and_undeclared(self):
+        """
+        Test that drift compares keys and options of the declared indexes with
+        the ones on the collection, ignoring the default _id index.
+        """
+        collection = MagicMock()
+        collection.index_information = AsyncMock(return_value={
+            "_id_": {"v": 2, "key": [("_id", 1)]},
+            "username_unique": {"v": 2, "key": [("username", 1)]},
+            "legacy_name": {"v": 2, "key": [("full_name", 1)]},
+        })
+        manager = IndexManager(collection, [
+            IndexModel([("email", 1)], name="email_unique", unique=True),
+            IndexModel([("username", 1)], name="username_unique", unique=True),
+        ])
+
+        report = asyncio.run(manager.drift())
+
+        assert report["missing"] == ["email_unique"]
+        assert report["changed"] == ["username_unique"]
+        assert report["undeclared"] == ["legacy_name"]
+
+    def test_ensure_records_build_errors(self):
+        """
+        Test that a failed index build, e.g. because of existing duplicates,
+        is recorded instead of crashing the background task.
+        """
+        collection = MagicMock()
+        collection.create_indexes = AsyncMock(side_effect=Exception("E11000 duplicate key error"))
+        manager = IndexManager(collection, [IndexModel([("email", 1)], name="email_unique", unique=True)])
+
+        asyncio.run(manager.ensure())
+
+        assert "duplicate key" in manager.error
@@ -0,0 +1,211 @@
+from bson import ObjectId
+from cache.settings import CacheSettings
+from cache.users import UserCache
+from jobs.exports import UserExports, split_into_partitions
+from jobs.imports import UserImports
+from schema.exports import ExportJobStatus
+from schema.imports import ImportJobStatus
+from pymongo.errors import BulkWriteError
+from repositories.users import UsersRepository
+from unittest.mock import AsyncMock, MagicMock
+import asyncio
+import json
+import os
+
+
+async def upload(*parts):
+    for part in parts:
+        yield part
+
+
+class FakeJobsRepository:
+    """Keeps job statuses and rejected import rows in memory"""
+
+    def __init__(self):
+        self.statuses = {}
+        self.errors = {}
+
+    async def save(self, status):
+        self.statuses[status.id] = status.model_dump()
+
+    async def get(self, job_id):
+        return self.statuses.get(job_id)
+
+    async def add_errors(self, job_id, errors):
+        self.errors.setdefault(job_id, []).extend({"line": line, "error": error} for line, error in errors)
+
+    async def iterate_errors(self, job_id):
+        for error in self.errors.get(job_id, []):
+            yield error
+
+
+def users_repository(insert_many=None):
+    collection = MagicMock()
+    collection.with_options.return_value = collection
+    collection.insert_many = AsyncMock(side_effect=insert_many)
+    return UsersRepository(collection), collection
+
+
+class TestUserImports:
+
+    def run_import(self, tmp_path, source_format, parts, insert_many=None, chunk_size=2):
+        imports = UserImports(str(tmp_path))
+        repository, collection = users_repository(insert_many)
+        cache = UserCache(CacheSettings(enabled=False))
+        jobs = FakeJobsRepository()
+
+        async def run():
+            status = await imports.start(upload(*parts), source_format, chunk_size, repository, cache, jobs)
+            await imports.get(status.id).task
+            await imports.close()
+            return status.id
+
+        job_id = asyncio.run(run())
+        # What any worker would read back
+        status = ImportJobStatus.model_validate(jobs.statuses[job_id])
+        return status, jobs.errors.get(job_id, []), collection
+
+    def test_csv_rows_are_validated_and_inserted_in_chunks(self, tmp_path):
+        """
+        Test that a CSV upload, split across request chunks, is inserted in
+        chunks of chunk_size rows and that invalid rows are reported by line.
+        """
+        csv = (b"username,email,full_name,roles\n"
+               b"alice,alice@example.com,Alice,user;editor\n"
+               b"bob,not-an-email,,\n"
+               b"carol,carol@example.com,,\n")
+
+        status, errors, collection = self.run_import(tmp_path, "csv", [csv[:50], csv[50:]])
+
+        assert status.state == "succeeded"
+        assert (status.rows, status.inserted, status.failed) == (3, 2, 1)
+        assert status.size_bytes == len(csv)
+        assert [error["line"] for error in errors] == [3]
+        assert "email" in errors[0]["error"]
+        inserted = [call.args[0] for call in collection.insert_many.await_args_list]
+        assert [[user["username"] for user in chunk] for chunk in inserted] == [["alice"], ["carol"]]
+        assert inserted[0][0]["roles"] == ["user", "editor"]
+
+    def test_ndjson_duplicates_and_bad_lines_reach_the_report(self, tmp_path):
+        """
+        Test that NDJSON lines that are not JSON objects and rows rejected as
+        duplicates by MongoDB end up in the error report.
+        """
+        async def insert_many(documents, ordered):
+            raise BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "E11000"}]})
+
+        ndjson = (b'{"username": "alice", "email": "alice@example.com"}\n'
+                  b'{"username": "taken", "email": "taken@example.com"}\n'
+                  b'\n'
+                  b'not json\n')
+
+        status, errors, _ = self.run_import(tmp_path, "ndjson", [ndjson], insert_many)
+
+        assert status.state == "succeeded"
+        assert (status.rows, status.inserted, status.failed) == (3, 1, 2)
+        assert errors == [
+            {"line": 2, "error": "A user with this email or username already exists"},
+            {"line": 4, "error": errors[1]["error"]},
+        ]
+        assert errors[1]["error"].startswith("Invalid JSON")
+
+    def test_database_failure_fails_the_job(self, tmp_path):
+        """
+        Test that an error writing a chunk stops the import and is reported
+        in its status, and that the spooled upload is removed.
+        """
+        async def insert_many(documents, ordered):
+            raise RuntimeError("connection refused")
+
+        status, _, _ = self.run_import(tmp_path, "ndjson", [b'{"username": "alice", "email": "alice@example.com"}\n'],
+                                    insert_many)
+
+        assert status.state == "failed"
+        assert status.error == "connection refused"
+        assert status.finished_at is not None
+        assert list(tmp_path.iterdir()) == []
+
+
+class FakeUsersRepository:
+    """Serves sample_ids and iterate_range from a list of users"""
+
+    def __init__(self, users):
+        self.users = sorted(users, key=lambda user: user["_id"])
+        self.ranges = []
+
+    async def sample_ids(self, size):
+        return [user["_id"] for user in self.users[:size]]
+
+    async def iterate_range(self, lower=None, upper=None, batch_size=None):
+        self.ranges.append((lower, upper))
+        for user in self.users:
+            if (lower is None or user["_id"] >= lower) and (upper is None or user["_id"] < upper):
+                await asyncio.sleep(0)
+                yield {key: value for key, value in user.items() if key != "_id"}
+
+
+class TestUserExports:
+
+    @staticmethod
+    def make_users(count):
+        return [{"_id": ObjectId(), "username": f"user{i}", "email": f"user{i}@example.com",
+                 "full_name": "", "roles": ["user"]} for i in range(count)]
+
+    def run_export(self, tmp_path, repository, partitions, output_format="ndjson"):
+        exports = UserExports(str(tmp_path))
+        jobs = FakeJobsRepository()
+
+        async def run():
+            status = await exports.start(partitions, output_format, repository, jobs)
+            await exports.get(status.id).task
+            return status.id
+
+        job_id = asyncio.run(run())
+        # What any worker would read back
+        return ExportJobStatus.model_validate(jobs.statuses[job_id])
+
+    def test_ranges_cover_the_collection_once(self, tmp_path):
+        """
+        Test that sampled boundaries split the collection into contiguous
+        ranges and that every user lands in exactly one NDJSON shard.
+        """
+        users = self.make_users(250)
+        repository = FakeUsersRepository(users)
+
+        status = self.run_export(tmp_path, repository, partitions=4)
+
+        assert status.state == "succeeded"
+        assert status.documents == 250
+        assert [partition.file for partition in status.partitions] == [
+            f"users-{index:05d}-of-00004.ndjson" for index in range(4)
+        ]
+        assert repository.ranges[0][0] is None and repository.ranges[-1][1] is None
+        exported = []
+        for partition in status.partitions:
+            with open(os.path.join(status.directory, partition.file)) as shard:
+                lines = [json.loads(line) for line in shard]
+            assert len(lines) == partition.documents > 0
+            exported += [line["username"] for line in lines]
+        assert sorted(exported) == sorted(user["username"] for user in users)
+
+    def test_split_of_an_empty_collection_is_one_open_range(self):
+        """
+        Test that an empty collection is exported as a single open range.
+        """
+        assert asyncio.run(split_into_partitions(FakeUsersRepository([]), 8)) == [(None, None)]
+
+    def test_parquet_without_pyarrow_fails_the_export(self, tmp_path):
+        """
+        Test that a Parquet export fails with a clear error when pyarrow is
+        not installed, and succeeds when it is.
+        """
+        status = self.run_export(tmp_path, FakeUsersRepository(self.make_users(10)), 2, "parquet")
+
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            assert status.state == "failed"
+            assert status.error == "Parquet exports need the pyarrow package"
+        else:
+            assert status.state == "succeeded"
+            assert status.documents == 10
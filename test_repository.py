@@ -0,0 +1,188 @@
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from repositories.users import UsersRepository
+from repositories.write_behind import UserInsertBatcher
+from schema.user import User
+from unittest.mock import AsyncMock, MagicMock
+import asyncio
+import pytest
+
+
+class AsyncCursorMock:
+    """Minimal stand-in for an AsyncCursor that yields the given documents"""
+
+    def __init__(self, documents):
+        self.documents = list(documents)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+
+class TestUsersRepository:
+
+    def test_collection_options_applied_once(self):
+        """
+        Test that the repository configures the collection handle with its
+        codec options and concerns when it is created.
+        """
+        collection = MagicMock()
+
+        repository = UsersRepository(collection)
+
+        collection.with_options.assert_called_once_with(
+            codec_options=UsersRepository.CODEC_OPTIONS,
+            read_concern=UsersRepository.READ_CONCERN,
+            read_preference=UsersRepository.READ_PREFERENCE,
+            write_concern=UsersRepository.WRITE_CONCERN,
+        )
+        assert repository.collection is collection.with_options.return_value
+
+    def test_update_sets_user_fields_by_email(self):
+        """
+        Test that update matches on the current email and sets the new fields.
+        """
+        collection = MagicMock()
+        collection.with_options.return_value = collection
+        collection.update_one = AsyncMock()
+        user = User(username="johndoe", email="john.doe@example.com", full_name="John Doe")
+
+        asyncio.run(UsersRepository(collection).update("old@example.com", user))
+
+        collection.update_one.assert_called_once_with(
+            {"email": "old@example.com"},
+            {"$set": user.model_dump(by_alias=True)}
+        )
+
+    def test_search_many_reads_once_and_fans_out(self):
+        """
+        Test that search_many sends one $in query for every search and returns
+        the users matching each one, by email or by username.
+        """
+        john = {"username": "johndoe", "email": "john.doe@example.com", "full_name": "", "roles": []}
+        jane = {"username": "janedoe", "email": "jane.doe@example.com", "full_name": "", "roles": []}
+
+        async def cursor():
+            for user in (john, jane):
+                yield user
+
+        collection = MagicMock()
+        collection.with_options.return_value = collection
+        collection.find.return_value = cursor()
+        searches = ["johndoe", "jane.doe@example.com", "nobody"]
+
+        found = asyncio.run(UsersRepository(collection).search_many(searches))
+
+        assert found == {"johndoe": [john], "jane.doe@example.com": [jane], "nobody": []}
+        collection.find.assert_called_once_with(
+            {"$or": [{"email": {"$in": searches}}, {"username": {"$in": searches}}]},
+            UsersRepository.projection(include_id=True)
+        )
+
+    def test_insert_batch_returns_documents_and_errors_in_order(self):
+        """
+        Test that insert_batch writes one unordered insert_many and reports a
+        stored document or a DuplicateKeyError for each user.
+        """
+        collection = MagicMock()
+        collection.with_options.return_value = collection
+        collection.insert_many = AsyncMock(side_effect=BulkWriteError(
+            {"writeErrors": [{"index": 1, "code": 11000, "errmsg": "E11000 duplicate key error"}]}
+        ))
+        users = [User(username=f"user{i}", email=f"user{i}@example.com") for i in range(2)]
+
+        outcomes = asyncio.run(UsersRepository(collection).insert_batch(users))
+
+        assert outcomes[0]["username"] == "user0" and "_id" in outcomes[0]
+        assert isinstance(outcomes[1], DuplicateKeyError)
+        assert collection.insert_many.call_args.kwargs["ordered"] is False
+
+    def test_iterate_range_bounds_ids(self):
+        """
+        Test that iterate_range reads [lower, upper) and leaves a missing
+        bound open.
+        """
+        collection = MagicMock()
+        collection.with_options.return_value = collection
+        lower, upper = ObjectId(), ObjectId()
+
+        async def drain(**bounds):
+            collection.find.return_value.batch_size.return_value = AsyncCursorMock([])
+            return [user async for user in UsersRepository(collection).iterate_range(**bounds)]
+
+        asyncio.run(drain(lower=lower, upper=upper))
+        collection.find.assert_called_with({"_id": {"$gte": lower, "$lt": upper}}, UsersRepository.PUBLIC_PROJECTION)
+        asyncio.run(drain(lower=lower))
+        collection.find.assert_called_with({"_id": {"$gte": lower}}, UsersRepository.PUBLIC_PROJECTION)
+        asyncio.run(drain())
+        collection.find.assert_called_with({}, UsersRepository.PUBLIC_PROJECTION)
+
+class TestUserInsertBatcher:
+
+    @staticmethod
+    def batcher(insert_batch, interval_seconds=0.01, max_docs=100):
+        repository = MagicMock()
+        repository.insert_batch = AsyncMock(side_effect=insert_batch)
+        return UserInsertBatcher(repository, interval_seconds, max_docs), repository
+
+    def test_inserts_within_the_interval_share_one_batch(self):
+        """
+        Test that concurrent inserts are written with one insert_batch call
+        and each caller gets its own document or error.
+        """
+        async def insert_batch(users):
+            return [DuplicateKeyError("E11000") if user.username == "taken" else {"username": user.username}
+                    for user in users]
+
+        batcher, repository = self.batcher(insert_batch)
+        users = [User(username=name, email=f"{name}@example.com") for name in ("alice", "taken", "bob")]
+
+        async def run():
+            return await asyncio.gather(*(batcher.insert(user) for user in users), return_exceptions=True)
+
+        outcomes = asyncio.run(run())
+
+        assert outcomes[0] == {"username": "alice"}
+        assert isinstance(outcomes[1], DuplicateKeyError)
+        assert outcomes[2] == {"username": "bob"}
+        repository.insert_batch.assert_awaited_once()
+        assert batcher.metrics()["flushes"] == 1
+        assert batcher.metrics()["largest_batch"] == 3
+
+    def test_full_queue_flushes_without_waiting(self):
+        """
+        Test that reaching max_docs flushes at once and close() writes the rest.
+        """
+        async def insert_batch(users):
+            return [{"username": user.username} for user in users]
+
+        batcher, repository = self.batcher(insert_batch, interval_seconds=60, max_docs=2)
+        users = [User(username=f"user{i}", email=f"user{i}@example.com") for i in range(3)]
+
+        async def run():
+            first = await asyncio.gather(batcher.insert(users[0]), batcher.insert(users[1]))
+            last = asyncio.ensure_future(batcher.insert(users[2]))
+            await asyncio.sleep(0)
+            await batcher.close()
+            return first, await last
+
+        first, last = asyncio.run(run())
+
+        assert [user["username"] for user in first] == ["user0", "user1"]
+        assert last == {"username": "user2"}
+        assert [len(call.args[0]) for call in repository.insert_batch.await_args_list] == [2, 1]
+        assert batcher.metrics()["full_flushes"] == 1
+
+    def test_failed_flush_fails_every_caller(self):
+        """
+        Test that an error from the batch write reaches every queued caller.
+        """
+        batcher, _ = self.batcher(RuntimeError("down"), interval_seconds=0.001)
+        user = User(username="alice", email="alice@example.com")
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(batcher.insert(user))
+        assert batcher.metrics()["flushes"] == 1